@@ -1,12 +1,41 @@
 import os
+import math
 from tqdm import tqdm
 import json
+import time
+import errno
+import shutil
 import platform
+from functools import partial
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import fsindex
+import metrics
+import integrity
+import stems
 
 # === CONFIGURABLE ===
 cwd = os.getcwd()
 image_exts = ('.jpg', '.jpeg', '.png')
-n = 20  # Number of characters to compare
+n = 20  # Number of characters to compare in "prefix" mode
+match_mode = "stem"  # "stem" = canonical filename stem (stems.py; Roboflow suffixes stripped), "prefix" = first n
+# chars of filename (legacy), "hash" = file content digest, "near" = perceptual hash
+stem_match = "exact"  # "stem" mode: "exact", "prefix" or "similar" (thresholds are stems.py settings)
+hash_workers = 8  # Parallel hashing workers for "hash" and "near" modes
+hash_cache_file = "hash_cache.json"  # Digests keyed by (path, size, mtime); re-runs only hash new/changed files
+phash_kind = "dhash"  # "dhash" (gradient) or "phash" (DCT) for "near" mode
+near_radius = 6  # Max Hamming distance (of 64 bits) to count as a near-duplicate
+phash_batch = 4096  # Images decoded per NumPy hashing batch
+phash_cache_file = "phash_cache.json"  # Perceptual hashes, one stat-keyed cache per phash_kind
+flagGlobal = False  # True = one pass over every dataset instead of one base dataset against the rest
+keep_priority = []  # flagGlobal: datasets that keep their copy of a duplicate group, most preferred first; datasets
+# not listed come after them in name order
+flagIntegrity = False  # Skip images integrity.py flags as zero-byte, truncated, corrupt or of unknown format
+delete_mode = "delete"  # "delete" = os.remove; "quarantine" = rename into quarantine_dir (undo/purge later)
+quarantine_dir = "quarantine_duplicates"  # Relative to cwd, so moves stay on the same filesystem (O(1) rename)
+quarantine_workers = 8  # Renames issued concurrently
+flagDryRun = False  # Only report how many files and bytes delete_duplicates() would remove
+log_format = "jsonl"  # "jsonl" = one duplicate group per line, streamed while matching; "json" = one dict (legacy)
 flagShowMatches = True
 flagAutoShowLogs = False
 # === GLOBALS ===
@@ -14,31 +43,156 @@ datasets = []
 base_index = 0
 base_dataset = None
 base_img_path = ""
-base_prefixes = set()
-match_log = {}  # dataset_name -> list of dicts with image and label paths
+match_log = {}  # dataset_name -> list of dicts with image and label paths (log_format "json" only)
+match_counts = {}  # dataset_name -> logged matches (base dataset: distinct files)
+base_matches = set()  # base dataset images seen in a match
+log_stream = None  # open JSONL log while matching
+excluded_images = None  # absolute paths failing the integrity check, computed on first use
 
 # === FUNCTIONS ===
 def find_datasets():
     """Returns all dataset folders with images and labels."""
-    datasets = []
-    for name in os.listdir(cwd):
-        subdir = os.path.join(cwd, name)
-        if os.path.isdir(subdir):
-            if os.path.isdir(os.path.join(subdir, "images")) and os.path.isdir(os.path.join(subdir, "labels")):
-                datasets.append(name)
-    return datasets
-
-def collect_image_prefixes(images_path):
-    """Collects filename prefixes (first n chars) of images."""
-    prefixes = set()
-    for root, _, files in os.walk(images_path):
-        for file in files:
-            if file.lower().endswith(image_exts):
-                prefixes.add(file[:n])
-    return prefixes
-
-def dataset_selection():
-    global datasets, base_index, base_dataset, base_img_path, base_prefixes
+    return fsindex.get_index(cwd).find_datasets()
+
+def list_images(dataset):
+    """Returns (filename, full path) of every image under a dataset's images folder."""
+    global excluded_images
+    images_path = os.path.join(cwd, dataset, "images")
+    index = fsindex.get_index(cwd)
+    images = [(os.path.basename(rel), os.path.join(images_path, rel))
+              for rel in index.images(dataset, image_exts, recursive=True, ignore_case=True)]
+    if flagIntegrity:
+        if excluded_images is None:
+            excluded_images = integrity.bad_images(cwd)
+        images = [(file, path) for file, path in images if os.path.abspath(path) not in excluded_images]
+    return images
+
+def load_hash_cache(filename=None):
+    """Loads a stat-keyed cache: relative path -> [size, mtime_ns, value]."""
+    return fsindex.load_cache(os.path.join(cwd, filename or hash_cache_file))
+
+def save_hash_cache(cache, filename=None):
+    fsindex.save_cache(os.path.join(cwd, filename or hash_cache_file), cache)
+
+def hash_images(paths, cache, desc="Hashing images"):
+    """Returns {path: content digest}, hashing on a thread pool."""
+    def compute(pending):
+        metrics.count("files", len(pending))
+        with ThreadPoolExecutor(max_workers=hash_workers) as pool:
+            yield from pool.map(fsindex.file_digest, pending)
+    with metrics.stage("hash"):
+        return fsindex.cached_values(paths, cache, compute, desc, root=cwd)
+
+def load_gray(path, size):
+    """Decodes an image to a small grayscale pixel block; None if it cannot be read."""
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            return img.convert("L").resize(size, Image.BILINEAR).tobytes()
+    except Exception:
+        return None
+
+def perceptual_hashes(paths):
+    """Yields a 64-bit dHash/pHash per path (None if undecodable), hashing decoded pixels in NumPy batches."""
+    import numpy as np
+
+    size = (9, 8) if phash_kind == "dhash" else (32, 32)
+    if phash_kind == "phash":
+        k = np.arange(32)
+        dct = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / 64)
+
+    with ProcessPoolExecutor(max_workers=hash_workers) as pool:
+        for start in range(0, len(paths), phash_batch):
+            raw = list(pool.map(partial(load_gray, size=size), paths[start:start + phash_batch], chunksize=64))
+            valid = [i for i, pixels in enumerate(raw) if pixels is not None]
+            metrics.count("files", len(raw))
+            for i, pixels in enumerate(raw):
+                if pixels is None:
+                    metrics.warn("undecodable image (skipped)", paths[start + i])
+            hashes = [None] * len(raw)
+            if valid:
+                block = np.frombuffer(b"".join(raw[i] for i in valid), dtype=np.uint8)
+                block = block.reshape(len(valid), size[1], size[0]).astype(np.float32)
+                if phash_kind == "dhash":
+                    bits = block[:, :, 1:] > block[:, :, :-1]
+                else:
+                    low = (dct @ block @ dct.T)[:, :8, :8].reshape(len(valid), 64)
+                    bits = low > np.median(low[:, 1:], axis=1, keepdims=True)
+                packed = np.packbits(bits.reshape(len(valid), 64), axis=1).view(">u8").ravel()
+                for i, value in zip(valid, packed.tolist()):
+                    hashes[i] = value
+            yield from hashes
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class HashIndex:
+    """Multi-index hashing over 64-bit hashes. The bits are split into m substrings of about log2(expected_size)
+    bits, each with its own table. By pigeonhole, a hash within radius differs from the query by at most
+    radius // m bits in some substring, so a query probes every substring value within that sub-radius and only
+    verifies the hashes found there. Buckets then hold about one entry each and the work per query grows much
+    more slowly than the number of stored hashes."""
+
+    def __init__(self, radius, expected_size=1 << 16):
+        self.radius = radius
+        bits = min(32, max(8, round(math.log2(max(expected_size, 2)))))
+        count = max(1, 64 // bits)
+        bounds = [64 * i // count for i in range(count + 1)]
+        sub_radius = radius // count
+        self.bands = []  # (shift, mask, [xor flips within the sub-radius])
+        for lo, hi in zip(bounds, bounds[1:]):
+            width = hi - lo
+            flips = [sum(1 << b for b in bits_set)
+                     for k in range(min(sub_radius, width) + 1) for bits_set in combinations(range(width), k)]
+            self.bands.append((lo, (1 << width) - 1, flips))
+        self.tables = [{} for _ in self.bands]  # substring value -> [entry]
+        self.entries = {}  # hash -> entry; identical hashes share one
+        self.values = []  # entry -> hash
+        self.items = []  # entry -> [items]
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        entry = self.entries.get(value)
+        if entry is not None:
+            self.items[entry].append(item)
+            return
+        entry = self.entries[value] = len(self.values)
+        self.values.append(value)
+        self.items.append([item])
+        for table, (shift, mask, _) in zip(self.tables, self.bands):
+            table.setdefault((value >> shift) & mask, []).append(entry)
+
+    def query(self, value, radius=None):
+        """Returns [(distance, item)] for every stored hash within radius (at most the index's radius)."""
+        radius = self.radius if radius is None else min(radius, self.radius)
+        seen = set()
+        found = []
+        for table, (shift, mask, flips) in zip(self.tables, self.bands):
+            key = (value >> shift) & mask
+            for flip in flips:
+                for entry in table.get(key ^ flip, ()):
+                    if entry in seen:
+                        continue
+                    seen.add(entry)
+                    d = hamming(value, self.values[entry])
+                    if d <= radius:
+                        found.extend((d, item) for item in self.items[entry])
+        return found
+
+def image_keys(dataset, cache=None):
+    """Returns (filename, match key) for each image; the key depends on match_mode."""
+    images = list_images(dataset)
+    if match_mode == "hash":
+        digests = hash_images([path for _, path in images], cache, desc=f"Hashing {dataset}")
+        return [(file, digests[path]) for file, path in images]
+    if match_mode == "stem":
+        return [(file, stems.canonical_stem(file)) for file, _ in images]
+    return [(file, file[:n]) for file, _ in images]
+
+def dataset_selection(base_name=None):
+    """Picks the base dataset; prompts for its number unless base_name is given."""
+    global datasets, base_index, base_dataset, base_img_path
 
     print("Scanning for datasets...\n")
     datasets = find_datasets()
@@ -51,7 +205,10 @@ def dataset_selection():
     print("Found datasets:")
     for i, name in enumerate(datasets):
         print(f"{i+1}. {name}")
-    base_index = int(input("\nSelect the base dataset (number): ")) - 1
+    if base_name is None:
+        base_index = int(input("\nSelect the base dataset (number): ")) - 1
+    else:
+        base_index = datasets.index(base_name) if base_name in datasets else -1
 
     if base_index < 0 or base_index >= len(datasets):
         print("Invalid selection.")
@@ -59,61 +216,289 @@ def dataset_selection():
 
     base_dataset = datasets[base_index]
     print(f"\nSelected base dataset: {base_dataset}")
-    print(f"Matching based on first {n} characters of image filenames.")
-
-    # === Collect base prefixes ===
-    print("Collecting image prefixes from base dataset...")
+    if match_mode == "hash":
+        print("Matching based on image file contents (BLAKE2b digest).")
+    elif match_mode == "near":
+        print(f"Matching based on {phash_kind} perceptual hashes within Hamming distance {near_radius}.")
+    elif match_mode == "stem":
+        print(f"Matching based on canonical filename stems ({stem_match}).")
+    else:
+        print(f"Matching based on first {n} characters of image filenames.")
     base_img_path = os.path.join(cwd, base_dataset, "images")
-    base_prefixes = collect_image_prefixes(base_img_path)
 
-def find_duplicates():
-    global match_log
+def match_entry(dataset, filename):
+    return {
+        "image": "/".join((dataset, "images", filename)),
+        "label": "/".join((dataset, "labels", os.path.splitext(filename)[0] + ".txt"))
+    }
+
+def log_path(base_name=None, fmt=None):
+    return os.path.join(cwd, f"log_{base_name or base_dataset}.{fmt or log_format}")
+
+def start_match_log():
+    """Resets the match counters; with log_format "jsonl" opens log_<base>.jsonl so groups are written as found."""
+    global match_log, match_counts, log_stream
     match_log = {dataset: [] for dataset in datasets}
+    match_counts = {dataset: 0 for dataset in datasets}
+    base_matches.clear()
+    if log_format == "jsonl":
+        log_stream = open(log_path(), "w")
+
+def log_group(entries, keep=None):
+    """Records one duplicate group given as [(dataset, match_entry)]: one JSONL line, or appended to match_log."""
+    for dataset, entry in entries:
+        if dataset == base_dataset:
+            base_matches.add(entry["image"])
+            match_counts[dataset] = len(base_matches)
+        else:
+            match_counts[dataset] += 1
+    if log_stream is not None:
+        record = {"matches": [dict(entry, dataset=dataset) for dataset, entry in entries]}
+        if keep is not None:
+            record["keep"] = keep
+        log_stream.write(json.dumps(record) + "\n")
+    else:
+        for dataset, entry in entries:
+            match_log[dataset].append(entry)
+
+def finish_match_log():
+    global log_stream
+    if log_stream is not None:
+        log_stream.close()
+        log_stream = None
+
+def current_log():
+    """What delete_duplicates() should read: the JSONL log path, or the in-memory match_log."""
+    return log_path() if log_format == "jsonl" else match_log
+
+def posix_path(path):
+    return path.replace("\\", "/")
+
+def iter_log(path):
+    """Lazily yields (dataset, {"image", "label"}) from a JSONL log, or from a legacy JSON log (read whole).
+
+    Paths come back '/'-separated even if the log was written on Windows.
+    """
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    for match in json.loads(line)["matches"]:
+                        yield match["dataset"], {"image": posix_path(match["image"]), "label": posix_path(match["label"])}
+        else:
+            for dataset, entries in json.load(f).items():
+                for entry in entries:
+                    yield dataset, {"image": posix_path(entry["image"]), "label": posix_path(entry["label"])}
+
+def find_duplicates():
+    if match_mode == "near":
+        return find_near_duplicates()
+    start_match_log()
 
     print("Searching for duplicates in other datasets...\n")
     total_matches = 0
 
-    # Step 1: Index full filenames from base dataset by prefix
-    base_img_path = os.path.join(cwd, base_dataset, "images")
-    base_file_map = {}  # prefix -> [full filenames]
-    for root, _, files in os.walk(base_img_path):
-        for file in files:
-            if not file.lower().endswith(image_exts):
-                continue
-            prefix = file[:n]
-            base_file_map.setdefault(prefix, []).append(file)
+    cache = load_hash_cache() if match_mode == "hash" else None
+
+    # Step 1: Index full filenames from base dataset by match key (stem, prefix or digest)
+    if match_mode == "stem":
+        stem_index = stems.StemIndex(stem_match)
+        for file, _ in list_images(base_dataset):
+            stem_index.add(file, file)
+    else:
+        base_file_map = {}  # key -> [full filenames]
+        for file, key in image_keys(base_dataset, cache):
+            base_file_map.setdefault(key, []).append(file)
 
     # Step 2: Scan other datasets
     for dataset in tqdm(datasets, desc="Scanning datasets", unit="dataset"):
         if dataset == base_dataset:
             continue
 
-        img_path = os.path.join(cwd, dataset, "images")
-        lbl_path = os.path.join(cwd, dataset, "labels")
+        for file, key in image_keys(dataset, cache):
+            base_files = stem_index.match(file) if match_mode == "stem" else base_file_map.get(key)
+            if base_files:
+                # Log match from current dataset together with *all* base dataset files that match the key
+                log_group([(dataset, match_entry(dataset, file))] +
+                          [(base_dataset, match_entry(base_dataset, base_filename)) for base_filename in base_files])
+                total_matches += 1
 
-        for root, _, files in os.walk(img_path):
-            for file in files:
-                if not file.lower().endswith(image_exts):
-                    continue
+    finish_match_log()
+    if cache is not None:
+        save_hash_cache(cache)
+
+    summarize_matches(total_matches)
 
-                prefix = file[:n]
-                if prefix in base_prefixes:
-                    # Log match from current dataset
-                    match_log[dataset].append({
-                        "image": os.path.join(dataset, "images", file),
-                        "label": os.path.join(dataset, "labels", os.path.splitext(file)[0] + ".txt")
-                    })
+def find_near_duplicates():
+    """Near-duplicate search: base perceptual hashes go into a HashIndex and every other image is a radius query."""
+    start_match_log()
 
-                    # Log *all* base dataset files that match prefix (with real full names)
-                    for base_filename in base_file_map.get(prefix, []):
-                        match_log[base_dataset].append({
-                            "image": os.path.join(base_dataset, "images", base_filename),
-                            "label": os.path.join(base_dataset, "labels", os.path.splitext(base_filename)[0] + ".txt")
-                        })
+    print("Searching for near-duplicates in other datasets...\n")
+    total_matches = 0
+    cache = load_hash_cache(phash_cache_file)
+    kind_cache = cache.setdefault(phash_kind, {})
+
+    # Step 1: Index base dataset hashes
+    base_images = list_images(base_dataset)
+    hash_index = HashIndex(near_radius, len(base_images))
+    base_hashes = fsindex.cached_values([path for _, path in base_images], kind_cache, perceptual_hashes,
+                                        f"Hashing {base_dataset}", root=cwd)
+    for file, path in base_images:
+        if base_hashes[path] is not None:
+            hash_index.add(base_hashes[path], file)
+
+    # Step 2: Radius-query every image of the other datasets
+    clusters = {}  # base filename -> [{"image", "distance"}]
+    for dataset in tqdm(datasets, desc="Scanning datasets", unit="dataset"):
+        if dataset == base_dataset:
+            continue
+
+        images = list_images(dataset)
+        hashes = fsindex.cached_values([path for _, path in images], kind_cache, perceptual_hashes,
+                                       f"Hashing {dataset}", root=cwd)
+        for file, path in images:
+            if hashes[path] is None:
+                continue
+            hits = hash_index.query(hashes[path], near_radius)
+            if not hits:
+                continue
 
-                    total_matches += 1
+            entry = match_entry(dataset, file)
+            log_group([(dataset, entry)] + [(base_dataset, match_entry(base_dataset, base_filename)) for _, base_filename in sorted(hits)])
+            for distance, base_filename in sorted(hits):
+                clusters.setdefault(base_filename, []).append({"image": entry["image"], "distance": distance})
+            total_matches += 1
+
+    finish_match_log()
+    save_hash_cache(cache, phash_cache_file)
+
+    # Step 3: Save clusters with their distances
+    report = [
+        {"base": match_entry(base_dataset, base_filename)["image"], "matches": sorted(members, key=lambda m: m["distance"])}
+        for base_filename, members in sorted(clusters.items())
+    ]
+    report_path = os.path.join(cwd, f"near_log_{base_dataset}.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nNear-duplicate clusters saved as: {report_path}")
+
+    summarize_matches(total_matches)
+
+def keeper_rank(dataset):
+    if dataset in keep_priority:
+        return (0, keep_priority.index(dataset), dataset)
+    return (1, 0, dataset)
+
+def find_duplicates_global():
+    """Indexes every dataset in one walk and reports every cross-dataset duplicate group plus an overlap matrix.
+
+    The group's dataset ranked first by keep_priority (then by name) keeps its files; the other members go to
+    match_log so delete_duplicates() removes only redundant copies.
+    """
+    global base_dataset
+    base_dataset = "global"
+    start_match_log()
+
+    print("Indexing all datasets in a single pass...\n")
+
+    # Step 1: Key every image of every dataset
+    members = []  # (dataset, filename) in walk order
+    keys = []
+    if match_mode == "near":
+        cache = load_hash_cache(phash_cache_file)
+        kind_cache = cache.setdefault(phash_kind, {})
+    else:
+        cache = load_hash_cache() if match_mode == "hash" else None
+
+    for dataset in tqdm(datasets, desc="Indexing datasets", unit="dataset"):
+        if match_mode == "near":
+            images = list_images(dataset)
+            hashes = fsindex.cached_values([path for _, path in images], kind_cache, perceptual_hashes,
+                                           f"Hashing {dataset}", root=cwd)
+            keyed = [(file, hashes[path]) for file, path in images if hashes[path] is not None]
+        else:
+            keyed = image_keys(dataset, cache)
+        for file, key in keyed:
+            members.append((dataset, file))
+            keys.append(key)
+
+    if match_mode == "near":
+        save_hash_cache(cache, phash_cache_file)
+    elif cache is not None:
+        save_hash_cache(cache)
+
+    # Step 2: Group members sharing a key (or within near_radius / matching stems, joined with union-find)
+    if match_mode == "near" or (match_mode == "stem" and stem_match != "exact"):
+        parent = list(range(len(members)))
+
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        if match_mode == "near":
+            hash_index = HashIndex(near_radius, len(keys))
+            for i, value in enumerate(keys):
+                for _, j in hash_index.query(value, near_radius):
+                    parent[root(i)] = root(j)
+                hash_index.add(value, i)
+        else:
+            stem_index = stems.StemIndex(stem_match)
+            for i, (_, file) in enumerate(members):
+                for stem in stem_index.lookup(file):
+                    parent[root(i)] = root(stem_index.items[stem][0])
+                stem_index.add(file, i)
+        keys = [root(i) for i in range(len(members))]
+
+    groups = {}  # key -> [member index]
+    for i, key in enumerate(keys):
+        groups.setdefault(key, []).append(i)
+
+    # Step 3: Keep cross-dataset groups, log redundant copies and count pairwise overlap
+    overlap = {a: {b: 0 for b in datasets} for a in datasets}
+    report = []
+    total_matches = 0
+    for key, indices in groups.items():
+        group_datasets = list(dict.fromkeys(members[i][0] for i in indices))
+        if len(group_datasets) < 2:
+            continue
 
-    # Step 3: Deduplicate base dataset entries
+        keeper = min(group_datasets, key=keeper_rank)
+        copies = [(members[i][0], match_entry(*members[i])) for i in indices if members[i][0] != keeper]
+        log_group(copies, keep=keeper)
+        total_matches += len(copies)
+        for a in group_datasets:
+            for b in group_datasets:
+                if a != b:
+                    overlap[a][b] += 1
+        report.append({
+            "keep": keeper,
+            "images": [match_entry(*members[i])["image"] for i in indices]
+        })
+
+    finish_match_log()
+    report_path = os.path.join(cwd, "groups_global.json")
+    with open(report_path, "w") as f:
+        json.dump({"groups": report, "overlap": overlap}, f, indent=4)
+
+    # Step 4: Print summary and overlap matrix
+    print(f"\nCross-dataset duplicate groups: {len(report)} (saved as: {report_path})")
+    print("\nDuplicate Match Summary (copies outside the keeping dataset):")
+    for dataset, count in match_counts.items():
+        if count:
+            print(f"- {dataset}: {count} matches")
+    print(f"\nTotal duplicate matches: {total_matches}")
+
+    width = max([len(name) for name in datasets] + [6])
+    print("\nDataset overlap (shared duplicate groups):")
+    print(" " * width + " ".join(f"{name:>{width}}" for name in datasets))
+    for a in datasets:
+        print(f"{a:<{width}}" + " ".join(f"{(overlap[a][b] if a != b else '-'):>{width}}" for b in datasets))
+
+def summarize_matches(total_matches):
+    """Deduplicates base dataset entries and prints the match summary."""
+    # Deduplicate base dataset entries (the JSONL log keeps them per group; delete_duplicates() skips repeats)
     seen = set()
     deduped = []
     for entry in match_log[base_dataset]:
@@ -123,27 +508,28 @@ def find_duplicates():
             seen.add(key)
     match_log[base_dataset] = deduped
 
-    # Step 4: Print summary
+    # Print summary
     print("\nDuplicate Match Summary (excluding base dataset):")
-    for dataset, entries in match_log.items():
-        if dataset != base_dataset and entries:
-            print(f"- {dataset}: {len(entries)} matches")
+    for dataset, count in match_counts.items():
+        if dataset != base_dataset and count:
+            print(f"- {dataset}: {count} matches")
 
-    base_match_count = len(match_log.get(base_dataset, []))
+    base_match_count = match_counts.get(base_dataset, 0)
     print(f"\nBase Dataset '{base_dataset}' has {base_match_count} matching files.")
     print(f"\nTotal duplicate matches (excluding base): {total_matches}")
 
 def save_match_log():
-    filename = f"log_{base_dataset}.json"
-    filepath = os.path.join(os.getcwd(), filename)
+    filepath = log_path()
 
-    # Convert any sets (if used) to lists before saving to JSON
-    serializable_log = {
-        dataset: list(matches) for dataset, matches in match_log.items()
-    }
+    if log_format == "json":
+        # Convert any sets (if used) to lists before saving to JSON
+        serializable_log = {
+            dataset: list(matches) for dataset, matches in match_log.items()
+        }
 
-    with open(filepath, "w") as f:
-        json.dump(serializable_log, f, indent=4)
+        with open(filepath, "w") as f:
+            json.dump(serializable_log, f, indent=4)
+    # "jsonl": already written group by group while matching
 
     print(f"\nMatch log saved as: {filepath}. View and confirm contents before continuing to data cleansing")
 
@@ -157,35 +543,60 @@ def save_match_log():
             os.system(f"xdg-open '{filepath}'")
 
 def load_log(base_dataset_name):
-    json_filename = f"log_{base_dataset_name}.json"
-    json_path = os.path.join(cwd, json_filename)
-
-    if not os.path.exists(json_path):
-        print(f"Match log not found: {json_path}")
-        return None
-
-    with open(json_path, 'r') as f:
-        match_log = json.load(f)
-
-    print(f"Loaded match log from: {json_path}")
-    return match_log
-
-def delete_duplicates(base_dataset, match_log):
-    datasets = list(match_log.keys())
+    """Path of the dataset's match log in log_format, else in the other format (legacy logs); None if there is none.
+
+    The log is not read here: delete_duplicates() streams it through iter_log().
+    """
+    for fmt in (log_format, "json" if log_format == "jsonl" else "jsonl"):
+        json_path = log_path(base_dataset_name, fmt)
+        if os.path.exists(json_path):
+            print(f"Loaded match log from: {json_path}")
+            return json_path
+
+    print(f"Match log not found: {log_path(base_dataset_name)}")
+    return None
+
+def is_indexed(index, path):
+    """Whether path is a file in the shared index (replaces a per-file os.path.exists)."""
+    rel = os.path.relpath(path, index.root).replace(os.sep, "/")
+    parts = rel.split("/", 2)
+    return len(parts) == 3 and parts[2] in index.files(parts[0], parts[1])
+
+def delete_duplicates(base_dataset, match_log, choice=None, selection=None, assume_yes=False):
+    """Deletes logged duplicates. match_log is a log path (streamed via iter_log) or an in-memory match_log dict.
+    choice ('1'-'4'), selection (dataset names for '2') and assume_yes skip the prompts for unattended runs."""
+    if isinstance(match_log, str):
+        log_file = match_log
+        entries = lambda: iter_log(log_file)
+        counts = {}
+        base_images = set()  # base files repeat once per group they matched; count them once
+        for dataset, entry in entries():  # counting pass; only base dataset names are kept
+            if dataset == base_dataset:
+                base_images.add(entry["image"])
+                counts[dataset] = len(base_images)
+            else:
+                counts[dataset] = counts.get(dataset, 0) + 1
+    else:
+        entries = lambda: ((dataset, entry) for dataset, items in match_log.items() for entry in items)
+        counts = {dataset: len(items) for dataset, items in match_log.items()}
+    datasets = list(counts.keys())
     if base_dataset in datasets:
         datasets.remove(base_dataset)
 
-    # Show deletion options
-    print("\n---Deletion Options:---")
-    print("1. Delete all duplicates (excluding base dataset)")
-    print("2. Manually select datasets to delete from")
-    print("3. Delete duplicates only from base dataset")
-    print("4. Cancel deletion")
+    if choice is None:
+        # Show deletion options
+        print("\n---Deletion Options:---")
+        print("1. Delete all duplicates (excluding base dataset)")
+        print("2. Manually select datasets to delete from")
+        print("3. Delete duplicates only from base dataset")
+        print("4. Cancel deletion")
 
-    choice = input("Select option (1-4): ")
+        choice = input("Select option (1-4): ")
 
     if choice == '1':
         to_delete = datasets
+    elif choice == '2' and selection is not None:
+        to_delete = [name for name in selection if name in datasets]
     elif choice == '2':
         print("Available datasets:")
         for i, name in enumerate(datasets):
@@ -210,41 +621,203 @@ def delete_duplicates(base_dataset, match_log):
     print("\nYou are about to delete data from the following datasets:")
     for name in to_delete:
         print(f"- {name}")
-    confirm = input("Are you sure? (y/n): ").strip().lower()
+    confirm = 'y' if assume_yes else input("Are you sure? (y/n): ").strip().lower()
     if confirm != 'y':
         print(" Deletion cancelled.")
         return
 
+    # Count total files to delete
+    total_files = sum(counts.get(name, 0) * 2 for name in to_delete)  # 2 = image + label
+    index = fsindex.get_index(cwd)
+    to_delete = set(to_delete)
+
+    def targets():
+        """Absolute paths of logged files that are still present, each once."""
+        seen_base = set()  # base files repeat once per group they matched
+        for name, item in entries():
+            if name not in to_delete:
+                continue
+            if name == base_dataset:
+                if item['image'] in seen_base:
+                    continue
+                seen_base.add(item['image'])
+            for file_path in [item['image'], item['label']]:
+                abs_path = os.path.normpath(os.path.join(cwd, file_path))
+                if is_indexed(index, abs_path):
+                    yield abs_path
+                else:
+                    metrics.warn("file not found (skipped)", abs_path)
+
+    if flagDryRun:
+        files, size = 0, 0
+        for path in targets():
+            files += 1
+            size += index.stat(path)[0]
+        freed = "would free" if delete_mode == "delete" else "would be quarantined (freed on purge)"
+        print(f"\nDry run: {files} files, {size / (1024 * 1024):.1f} MB {freed}.")
+        return
+
+    if delete_mode == "quarantine":
+        print("\nQuarantining files...")
+        quarantine_files(tqdm(targets(), total=total_files, desc="Quarantining files"))
+        fsindex.get_index(cwd, refresh=True)
+        return
+
     # Perform deletion
     print("\nDeleting files...")
-
-    # Count total files to delete
-    total_files = sum(len(match_log.get(name, [])) * 2 for name in to_delete)  # 2 = image + label
-    with tqdm(total=total_files, desc="Deleting files") as pbar:
-        for name in to_delete:
-            for item in match_log.get(name, []):
-                for file_path in [item['image'], item['label']]:
-                    abs_path = os.path.normpath(os.path.join(cwd, file_path))
-                    if os.path.exists(abs_path):
-                        try:
-                            os.remove(abs_path)
-                        except Exception as e:
-                            print(f"Error deleting {abs_path}: {e}")
-                    else:
-                        print(f"File not found (skipped): {abs_path}")
-                    pbar.update(1)
+    with metrics.stage("delete"):
+        for abs_path in tqdm(targets(), total=total_files, desc="Deleting files"):
+            try:
+                os.remove(abs_path)
+                metrics.count("files")
+                metrics.count("unlink")
+            except FileNotFoundError:
+                metrics.warn("file not found (skipped)", abs_path)  # listed twice in the log
+            except OSError as e:
+                metrics.warn("delete failed", f"{abs_path}: {e}")
+    fsindex.get_index(cwd, refresh=True)
 
     print("\nDeletion completed.")
 
+# === QUARANTINE ===
+def move_file(src, dst):
+    """Renames src to dst (copy + delete across filesystems); False if it failed."""
+    try:
+        try:
+            os.rename(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.move(src, dst)
+            metrics.count("copy")
+        metrics.count("rename")
+        return True
+    except OSError as e:
+        metrics.warn("move failed", f"{src}: {e}")
+        return False
+
+def move_batch(jobs):
+    """Moves (src, dst) pairs on a thread pool, creating destination folders first; returns how many moved."""
+    for directory in {os.path.dirname(dst) for _, dst in jobs}:
+        os.makedirs(directory, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=quarantine_workers) as pool:
+        return sum(pool.map(lambda job: move_file(*job), jobs))
+
+def quarantine_files(paths, batch_size=1000):
+    """Moves files under cwd into quarantine_dir/<run id>/, keeping their relative paths.
+
+    Every batch is written to the run's journal.jsonl before it is moved, so undo_quarantine() can put back
+    whatever an interrupted run already moved.
+    """
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    os.makedirs(os.path.join(cwd, quarantine_dir), exist_ok=True)
+    attempt = 0
+    while True:  # runs started within the same second get -001, -002, ... (still sorting oldest first)
+        run_id = stamp if attempt == 0 else f"{stamp}-{attempt:03d}"
+        run_dir = os.path.join(cwd, quarantine_dir, run_id)
+        try:
+            os.mkdir(run_dir)
+            break
+        except FileExistsError:
+            attempt += 1
+    moved = 0
+    with metrics.stage("quarantine"), open(os.path.join(run_dir, "journal.jsonl"), "x") as journal:
+        def flush(batch):
+            jobs = [(src, os.path.join(run_dir, os.path.relpath(src, cwd))) for src in batch]
+            for src, dst in jobs:
+                journal.write(json.dumps({"src": os.path.relpath(src, cwd).replace(os.sep, "/"),
+                                          "dst": os.path.relpath(dst, cwd).replace(os.sep, "/")}) + "\n")
+            journal.flush()
+            metrics.count("files", len(jobs))
+            return move_batch(jobs)
+
+        batch = []
+        for path in paths:
+            batch.append(path)
+            if len(batch) >= batch_size:
+                moved += flush(batch)
+                batch = []
+        if batch:
+            moved += flush(batch)
+    print(f"Quarantined {moved} files in {run_dir}. Undo with undo_quarantine('{run_id}') "
+          f"(pipeline.py undo), free the space with purge_quarantine('{run_id}') (pipeline.py purge).")
+    return run_id
+
+def quarantine_runs():
+    """Run ids in quarantine_dir, oldest first."""
+    root = os.path.join(cwd, quarantine_dir)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name, "journal.jsonl")))
+
+def undo_quarantine(run_id=None):
+    """Moves every file of a quarantine run (default: the latest) back to where it came from."""
+    runs = quarantine_runs()
+    run_id = run_id or (runs[-1] if runs else None)
+    if run_id not in runs:
+        print(f"No quarantine run '{run_id}' in {os.path.join(cwd, quarantine_dir)}")
+        return 0
+    run_dir = os.path.join(cwd, quarantine_dir, run_id)
+    jobs = []
+    blocked = 0
+    with open(os.path.join(run_dir, "journal.jsonl"), "r") as journal:
+        for line in journal:
+            entry = json.loads(line)
+            src, dst = os.path.join(cwd, entry["src"]), os.path.join(cwd, entry["dst"])
+            if not os.path.exists(dst):
+                continue  # never moved (interrupted run)
+            if os.path.exists(src):
+                metrics.warn("undo target exists (left in quarantine)", src)
+                blocked += 1
+                continue
+            jobs.append((dst, src))
+    with metrics.stage("undo_quarantine"):
+        restored = move_batch(jobs) if jobs else 0
+        metrics.count("files", restored)
+    if restored == len(jobs) and not blocked:
+        shutil.rmtree(run_dir)
+    fsindex.get_index(cwd, refresh=True)
+    print(f"Restored {restored} files from quarantine run {run_id}.")
+    return restored
+
+def purge_quarantine(run_id=None):
+    """Permanently deletes one quarantine run, or every run with run_id="all"; returns the bytes freed."""
+    runs = quarantine_runs()
+    selected = runs if run_id == "all" else [run_id or (runs[-1] if runs else None)]
+    freed = 0
+    for run in selected:
+        if run not in runs:
+            print(f"No quarantine run '{run}' in {os.path.join(cwd, quarantine_dir)}")
+            continue
+        run_dir = os.path.join(cwd, quarantine_dir, run)
+        for directory, _, files in os.walk(run_dir):
+            freed += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+        shutil.rmtree(run_dir)
+        print(f"Purged quarantine run {run}.")
+    print(f"Freed {freed / (1024 * 1024):.1f} MB.")
+    return freed
+
 # === RUN ===
 if __name__ == "__main__":
-    dataset_selection()
-    input("Press Enter to start scanning for duplicates...")
-    find_duplicates()
+    if flagGlobal:
+        datasets = find_datasets()
+        if not datasets:
+            print("No valid datasets found.")
+            exit()
+        print(f"Found {len(datasets)} datasets: {', '.join(datasets)}")
+        input("Press Enter to start scanning for duplicates...")
+        with metrics.stage("find_duplicates"):
+            find_duplicates_global()
+    else:
+        dataset_selection()
+        input("Press Enter to start scanning for duplicates...")
+        with metrics.stage("find_duplicates"):
+            find_duplicates()
     save_match_log()
     input("Press Enter to start duplicate deletion...")
-    match_log = load_log(str(base_dataset))
+    log_file = load_log(str(base_dataset))
     # Options 1. delete all matches (except basedataset), 2. manually delete from datasets (input of: 1,2,5,4 (index of dataset)), 3. delete only from base, 4. cancel deletion.
-    if match_log:
-        delete_duplicates(base_dataset, match_log)
+    if log_file:
+        delete_duplicates(base_dataset, log_file)
+    metrics.report()
     
\ No newline at end of file
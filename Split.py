@@ -1,7 +1,19 @@
 import os
 import sys
+import time
+import json
+import errno
 import shutil
+import hashlib
 import random
+import tarfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import fsindex
+import metrics
+import integrity
+import pairing
+import stems
 from tqdm import tqdm #make sure tdqm is installed in local system, dami tutorial install lang
 '''
 The dataset split is carried in steps;
@@ -16,6 +28,35 @@ The dataset split is carried in steps;
 # Setup
 parent_dir = os.getcwd()
 base_dir = os.path.join(os.getcwd(), "Finaldata") #Output Dataset
+# "files" = build Finaldata/images|labels/{train,val,test}; "manifest" = only write train/val/test.txt + data.yaml
+# listing the original images (no file copying); "shards" = WebDataset-style tar shards in Finaldata/shards/
+output_mode = "files"
+shard_size = 1000 # Image/label samples per tar shard ("shards" mode)
+shard_workers = 4 # Shards written concurrently, each as one sequential stream
+class_names = ["Tricycle"] # data.yaml class names, index = class id
+# How files are placed in Finaldata: "hardlink", "reflink" (copy-on-write clone), "symlink" (relative) or "copy"
+# Every file falls back to the next method when one fails (e.g. hardlink across devices -> reflink -> copy)
+materialize_mode = "copy"
+copy_workers = 8 # Image/label pairs placed concurrently
+copy_retries = 3 # Retries per pair on transient I/O errors (EAGAIN, EIO, ETIMEDOUT, ...)
+# Incremental re-split: keep earlier assignments from Finaldata/split_manifest.json, place new files by a seeded
+# hash of their path, remove outputs whose source disappeared, and only copy what changed
+flagIncremental = False
+split_seed = 0
+# "random" = shuffle single images; "group" = keep Roboflow variants of one source photo (same stem before _jpg.rf.)
+# together and assign whole groups, stratified by label class ids, so augmentations cannot leak across splits
+split_strategy = "random"
+# Downscale images whose longer side exceeds resize_max_side and re-encode them ("files" and "shards" modes; YOLO
+# labels are normalised, so they stay valid). Outputs are cached by source digest + settings in resize_cache_dir
+flagResize = False
+resize_max_side = 640
+resize_quality = 90 # JPEG quality of re-encoded images (PNG stays lossless)
+resize_workers = 8 # Processes re-encoding concurrently
+resize_cache_dir = ".resize_cache" # Relative to parent_dir; keep it on the same filesystem as Finaldata for hardlinks
+# Leave out images integrity.py flags as zero-byte, truncated, corrupt or of unknown format (verdicts are cached)
+flagIntegrity = False
+# Run pairing.py's image/label check first and apply pairing.action (exclude / quarantine / empty_label) in bulk
+flagPreflight = False
 
 # Supported image extensions
 image_exts = ('.jpg', '.jpeg', '.png')
@@ -31,6 +72,16 @@ final_train = 0
 final_val = 0
 final_test = 0
 final_total = 0
+bytes_written = 0
+materialize_counts = {}  # method -> files placed with it
+files_placed = 0
+copy_seconds = 0.0
+previous_assignments = {}  # source image (relative to parent_dir) -> split, from the last incremental run
+current_assignments = {}
+train_stems = set()  # source stems used by train/val in "group" strategy; excluded from test
+excluded_images = set()  # absolute paths left out by the pre-flight and integrity checks
+resized_sources = {}  # source image -> re-encoded copy in resize_cache_dir (flagResize)
+bytes_saved = 0
 #TVT Split
 trainRatio = 0.7
 valRatio = 0.2
@@ -41,6 +92,7 @@ tempValRatio = 0.2222
 tempTestRatio = 0.1111
 
 #logger
+flagInteractive = True # False = never wait on input() (pipeline.py / unattended runs)
 flagDSManual = False
 flagDSManual2 = False
 flagCSW = False
@@ -56,6 +108,399 @@ dataset
 |->labels
 '''
 # === Functions ===
+FICLONE = 0x40049409  # Linux ioctl: share src extents with dst (btrfs, XFS, bcachefs)
+MATERIALIZE_CHAIN = {
+    "hardlink": ("hardlink", "reflink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "symlink": ("symlink", "copy"),
+    "copy": ("copy",),
+}
+
+def reflink(src, dst):
+    import fcntl  # not available on Windows; the ImportError triggers the copy fallback
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+def materialize(src, dst):
+    """Places src at dst with materialize_mode, falling back per file; returns (method used, bytes written)."""
+    chain = MATERIALIZE_CHAIN[materialize_mode]
+    if os.path.lexists(dst):
+        os.remove(dst)
+    for method in chain:
+        try:
+            if method == "hardlink":
+                os.link(src, dst)
+                return method, 0
+            if method == "reflink":
+                reflink(src, dst)
+                return method, 0
+            if method == "symlink":
+                os.symlink(os.path.relpath(os.path.abspath(src), os.path.dirname(os.path.abspath(dst))), dst)
+                return method, 0
+            shutil.copy2(src, dst)
+            return method, os.path.getsize(dst)
+        except (OSError, ImportError):
+            if os.path.lexists(dst):
+                os.remove(dst)
+            if method == chain[-1]:
+                raise
+
+TRANSIENT_ERRNOS = {errno.EAGAIN, errno.EBUSY, errno.EINTR, errno.EIO, errno.ETIMEDOUT, getattr(errno, "ESTALE", errno.EIO)}
+
+def place_pair(img_src, img_dst, lbl_src, lbl_dst):
+    """Places an image and its label (None = missing) as one unit; returns [(method, bytes)] and whether the label existed."""
+    for attempt in range(copy_retries + 1):
+        try:
+            results = [materialize(img_src, img_dst)]
+            if lbl_src is not None:
+                results.append(materialize(lbl_src, lbl_dst))
+            return results, lbl_src is not None
+        except OSError as e:
+            if e.errno not in TRANSIENT_ERRNOS or attempt == copy_retries:
+                raise
+            metrics.count("retry")
+            time.sleep(0.1 * 2 ** attempt)
+
+def copy_pairs(jobs, desc):
+    """Runs (img_src, img_dst, lbl_src, lbl_dst) jobs on a bounded thread pool.
+
+    Results are consumed in submission order, so counters and missing-label reports do not depend on which
+    worker finishes first. Returns the image sources whose label was missing.
+    """
+    global bytes_written, files_placed, copy_seconds
+    missing = []
+    start = time.time()
+    written = 0
+    placed = 0
+    with metrics.stage("copy"), ThreadPoolExecutor(max_workers=copy_workers) as pool, \
+            tqdm(total=len(jobs), desc=desc, unit="pair") as pbar:
+        for job, (results, has_label) in zip(jobs, pool.map(lambda job: place_pair(*job), jobs)):
+            for method, nbytes in results:
+                materialize_counts[method] = materialize_counts.get(method, 0) + 1
+                metrics.count(method)
+                metrics.count("files")
+                metrics.count("bytes_written", nbytes)
+                written += nbytes
+                placed += 1
+            if not has_label:
+                missing.append(job[0])
+            elapsed = max(time.time() - start, 1e-9)
+            pbar.set_postfix_str(f"{placed / elapsed:.0f} files/s, {written / elapsed / (1024 * 1024):.1f} MB/s", refresh=False)
+            pbar.update(1)
+
+    bytes_written += written
+    files_placed += placed
+    copy_seconds += time.time() - start
+    return missing
+
+def yolo_label_path(img_path):
+    """Label path YOLO derives from an image path: last /images/ -> /labels/, extension -> .txt."""
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return os.path.splitext(sb.join(img_path.rsplit(sa, 1)))[0] + ".txt"
+
+def write_manifest(split, pairs):
+    """Writes Finaldata/<split>.txt listing absolute image paths; returns images without a YOLO-derivable label."""
+    os.makedirs(base_dir, exist_ok=True)
+    missing = []
+    with metrics.stage("manifest"), open(os.path.join(base_dir, f"{split}.txt"), "w") as f:
+        for img_src, lbl_src in pairs:
+            img_path = os.path.abspath(img_src)
+            f.write(img_path + "\n")
+            metrics.count("files")
+            # The index already knows lbl_src exists; only probe the disk when YOLO would look elsewhere
+            lbl_path = yolo_label_path(img_path)
+            if lbl_src is None:
+                missing.append(img_path)
+            elif os.path.abspath(lbl_src) != lbl_path:
+                metrics.count("isfile")
+                if not os.path.isfile(lbl_path):
+                    missing.append(img_path)
+    write_data_yaml()
+    return missing
+
+def write_data_yaml():
+    lines = [f"path: {os.path.abspath(base_dir)}"]
+    for split in ("train", "val", "test"):
+        if os.path.exists(os.path.join(base_dir, f"{split}.txt")):
+            lines.append(f"{split}: {split}.txt")
+    lines.append("names:")
+    lines.extend(f"  {i}: {name}" for i, name in enumerate(class_names))
+    with open(os.path.join(base_dir, "data.yaml"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def resize_image(src, dst, max_side, quality):
+    """Downscales src so its longer side is max_side and re-encodes it to dst (same format, EXIF kept so the
+    orientation the labels were drawn in does not change). Returns None, or the error if src could not be
+    decoded or dst not written."""
+    from PIL import Image
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst), suffix=".tmp")
+    os.close(fd)
+    try:
+        with Image.open(src) as img:
+            fmt = img.format
+            exif = img.info.get("exif")
+            scale = max_side / max(img.size)
+            resized = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+        options = {"exif": exif} if exif else {}
+        if fmt == "JPEG":
+            if resized.mode not in ("RGB", "L"):
+                resized = resized.convert("RGB")
+            options.update(quality=quality, optimize=True)
+        resized.save(tmp_path, format=fmt, **options)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; outputs are hardlinked/copied into Finaldata
+        os.replace(tmp_path, dst)
+    except Exception as e:  # corrupt scan data passes the header check; keep the source instead
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return f"{type(e).__name__}: {e}"
+    return None
+
+def resizeImages(pairs):
+    """Re-encodes every image of pairs whose longer side exceeds resize_max_side into resize_cache_dir and points
+    resized_sources at the copy. Sizes come from integrity.py's cached header check; only images whose
+    (digest, settings) output is not cached yet are decoded."""
+    global bytes_saved
+    cache_dir = os.path.join(parent_dir, resize_cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    sources = {os.path.join(parent_dir, img_src): img_src for img_src, _ in pairs if img_src not in resized_sources}
+    verdicts = integrity.verify(list(sources), parent_dir)
+    large = [path for path, (_, width, height, issue) in verdicts.items()
+             if issue not in integrity.exclude_issues and max(width, height) > resize_max_side]
+
+    digest_cache_path = os.path.join(cache_dir, "digests.json")
+    digest_cache = fsindex.load_cache(digest_cache_path)
+    def compute(pending):
+        with ThreadPoolExecutor(max_workers=copy_workers) as pool:
+            yield from pool.map(fsindex.file_digest, pending)
+    digests = fsindex.cached_values(large, digest_cache, compute, "Hashing large images", root=parent_dir)
+    fsindex.save_cache(digest_cache_path, digest_cache)
+
+    outputs = {path: os.path.join(cache_dir, f"{digests[path]}-{resize_max_side}-q{resize_quality}{os.path.splitext(path)[1].lower()}")
+               for path in large}
+    # Exact duplicates share a digest and thus an output: encode it once
+    jobs = list({out: (path, out) for path, out in outputs.items() if not os.path.exists(out)}.values())
+    failed_outputs = {}
+    with metrics.stage("resize"):
+        if jobs:
+            metrics.count("files", len(jobs))
+            with ProcessPoolExecutor(max_workers=resize_workers) as pool:
+                errors = list(tqdm(pool.map(resize_image, [src for src, _ in jobs], [out for _, out in jobs],
+                                            [resize_max_side] * len(jobs), [resize_quality] * len(jobs), chunksize=8),
+                                   total=len(jobs), desc="Resizing images", unit="img"))
+            for (path, out), error in zip(jobs, errors):
+                if error is not None:
+                    failed_outputs[out] = error
+            for path, out in list(outputs.items()):
+                if out in failed_outputs:
+                    metrics.warn("resize failed", f"{path} ({failed_outputs[out]})")
+                    del outputs[path]  # the split uses the original file
+        for path, out in outputs.items():
+            before, after = fsindex.get_index(parent_dir).stat(path)[0], os.path.getsize(out)
+            if after < before:  # re-encoding a well-compressed small file can make it bigger
+                resized_sources[sources[path]] = out
+                bytes_saved += before - after
+                metrics.count("bytes_saved", before - after)
+    encoded = len(jobs) - len(failed_outputs)
+    print(f"Resized {len(outputs)} of {len(sources)} images ({encoded} re-encoded, "
+          f"{len(outputs) - encoded} from cache or exact duplicates, {len(large) - len(outputs)} failed)")
+
+def sample_key(img_src):
+    """WebDataset sample key: the image stem with dots replaced, since readers split key and extension at the
+    first dot ('x_jpg.rf.<hash>' would otherwise lose everything after 'x_jpg')."""
+    return os.path.splitext(os.path.basename(img_src))[0].replace(".", "_")
+
+def write_shard(path, samples):
+    """Writes (key, img_src, lbl_src) samples to one tar file as {key}.<ext> + {key}.txt.
+
+    Returns ([[key, image offset, image size, label offset, label size]], tar size); offsets point at the member
+    data, -1 for a missing label.
+    """
+    members = []
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb", buffering=1 << 20) as f, tarfile.open(fileobj=f, mode="w") as tar:
+        for key, img_src, lbl_src in samples:
+            row = [key]
+            for src, ext in ((img_src, os.path.splitext(img_src)[1].lower()), (lbl_src, ".txt")):
+                if src is None:
+                    row += [-1, 0]
+                    continue
+                info = tar.gettarinfo(src, arcname=key + ext)
+                info.uid = info.gid = 0
+                info.uname = info.gname = ""
+                info.mode = 0o644
+                data_offset = tar.offset + len(info.tobuf(tar.format, tar.encoding, tar.errors))
+                with open(src, "rb") as fsrc:
+                    tar.addfile(info, fsrc)
+                row += [data_offset, info.size]
+            members.append(row)
+    size = os.path.getsize(tmp_path)
+    os.replace(tmp_path, path)
+    return members, size
+
+def write_shards(split, pairs):
+    """Writes one split as Finaldata/shards/<split>-NNNNN.tar (shard_size samples each, shuffled by split_seed)
+    and records per-shard counts and member offsets in shards/index.json. Returns images without a label."""
+    global bytes_written, files_placed, copy_seconds
+    shard_dir = os.path.join(base_dir, "shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    samples = [(sample_key(img_src), resized_sources.get(img_src, img_src), lbl_src) for img_src, lbl_src in pairs]
+    random.Random(f"{split_seed}:{split}").shuffle(samples)
+    chunks = [samples[i:i + shard_size] for i in range(0, len(samples), shard_size)]
+    names = [f"{split}-{i:05d}.tar" for i in range(len(chunks))]
+
+    start = time.time()
+    with metrics.stage("shards"), ThreadPoolExecutor(max_workers=shard_workers) as pool:
+        results = list(tqdm(pool.map(lambda job: write_shard(os.path.join(shard_dir, job[0]), job[1]), zip(names, chunks)),
+                            total=len(chunks), desc=f"Writing {split} shards", unit="shard"))
+        metrics.count("files", sum(1 + (lbl_src is not None) for _, _, lbl_src in samples))
+        metrics.count("bytes_written", sum(size for _, size in results))
+    copy_seconds += time.time() - start
+    bytes_written += sum(size for _, size in results)
+    files_placed += sum(1 + (lbl_src is not None) for _, _, lbl_src in samples)
+
+    for name in os.listdir(shard_dir):  # shards left over from an earlier, larger split
+        if name.startswith(f"{split}-") and name.endswith(".tar") and name not in names:
+            os.remove(os.path.join(shard_dir, name))
+
+    index_path = os.path.join(shard_dir, "index.json")
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    index[split] = {
+        "samples": len(samples),
+        "shards": [{"file": name, "samples": len(members), "bytes": size, "members": members}
+                   for name, (members, size) in zip(names, results)],
+    }
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+    return [img_src for _, img_src, lbl_src in samples if lbl_src is None]
+
+def source_key(img_path):
+    return os.path.relpath(os.path.abspath(img_path), parent_dir).replace(os.sep, "/")
+
+def assignment_key(img_path):
+    if split_strategy == "group":
+        return stems.source_stem(os.path.basename(img_path))
+    return source_key(img_path)
+
+def label_class_counts(lbl_src):
+    counts = {}
+    if lbl_src is not None:
+        with open(lbl_src, "r") as f:
+            for line in f:
+                parts = line.split()
+                if parts:
+                    counts[parts[0]] = counts.get(parts[0], 0) + 1
+    return counts
+
+def assign_groups(pairs, fractions):
+    """Splits (image, label) pairs into len(fractions) bins, moving whole source-stem groups.
+
+    Greedy largest-group-first: each group goes to the bin whose remaining quota (images and boxes per class,
+    normalised by their totals) it fills best. One pass over the groups, no search.
+    """
+    import numpy as np
+
+    groups = {}
+    for pair in pairs:
+        groups.setdefault(stems.source_stem(os.path.basename(pair[0])), []).append(pair)
+    keys = sorted(groups)
+    random.Random(split_seed).shuffle(keys)
+
+    # Per-group vector: [images, boxes of class 0, boxes of class 1, ...]
+    group_counts = []
+    class_ids = {}
+    for key in keys:
+        counts = {}
+        for _, lbl_src in groups[key]:
+            for cls, count in label_class_counts(lbl_src).items():
+                counts[cls] = counts.get(cls, 0) + count
+        for cls in counts:
+            class_ids.setdefault(cls, len(class_ids) + 1)
+        group_counts.append(counts)
+
+    matrix = np.zeros((len(keys), len(class_ids) + 1))
+    for g, (key, counts) in enumerate(zip(keys, group_counts)):
+        matrix[g, 0] = len(groups[key])
+        for cls, count in counts.items():
+            matrix[g, class_ids[cls]] = count
+
+    totals = matrix.sum(axis=0)
+    totals[totals == 0] = 1
+    targets = np.outer(fractions, totals)
+    current = np.zeros_like(targets)
+    bins = [[] for _ in fractions]
+    for g in np.argsort(-matrix[:, 0], kind="stable"):
+        row = matrix[g] / totals
+        b = int(np.argmax(((targets - current) / totals * row).sum(axis=1)))
+        current[b] += matrix[g]
+        bins[b].extend(groups[keys[g]])
+    return bins
+
+def stable_score(key):
+    """Seeded hash of a source path mapped to [0, 1); the same file always lands in the same place."""
+    digest = hashlib.blake2b(f"{split_seed}:{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+def load_split_manifest():
+    manifest_path = os.path.join(base_dir, "split_manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f).get("entries", {})
+
+def save_split_manifest():
+    os.makedirs(base_dir, exist_ok=True)
+    manifest_path = os.path.join(base_dir, "split_manifest.json")
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump({"seed": split_seed, "entries": current_assignments}, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def pending_pairs(split, pairs):
+    """Drops pairs an incremental run already placed in this split (and whose output still exists)."""
+    if not flagIncremental:
+        return pairs
+    img_dest = os.path.join(base_dir, "images", split)
+    return [(img_src, lbl_src) for img_src, lbl_src in pairs
+            if previous_assignments.get(source_key(img_src)) != split
+            or not os.path.lexists(os.path.join(img_dest, os.path.basename(img_src)))]
+
+def runChecks():
+    """Pre-flight pairing and integrity checks; fills excluded_images before anything is counted or copied."""
+    if flagPreflight:
+        excluded_images.update(pairing.preflight(parent_dir, train_folders + test_folders))
+    if flagIntegrity:
+        excluded_images.update(integrity.bad_images(parent_dir, train_folders + test_folders))
+
+def exclude_flagged(pairs):
+    """Drops (image, label) pairs whose image the pre-flight or integrity check left out."""
+    if not excluded_images:
+        return pairs
+    kept = [pair for pair in pairs if os.path.join(parent_dir, pair[0]) not in excluded_images]
+    if len(kept) < len(pairs):
+        print(f"Excluded {len(pairs) - len(kept)} images flagged by the pre-flight/integrity checks")
+    return kept
+
+def removeStaleOutputs():
+    """Deletes outputs of images that vanished from the sources or changed split, then saves the manifest."""
+    removed = 0
+    if output_mode == "files":
+        for key, split in previous_assignments.items():
+            if current_assignments.get(key) == split:
+                continue
+            img_file = os.path.basename(key)
+            for path in (os.path.join(base_dir, "images", split, img_file),
+                         os.path.join(base_dir, "labels", split, os.path.splitext(img_file)[0] + ".txt")):
+                if os.path.lexists(path):
+                    os.remove(path)
+            removed += 1
+    save_split_manifest()
+    kept = sum(1 for key, split in current_assignments.items() if previous_assignments.get(key) == split)
+    print(f"Incremental split: kept {kept}, added {len(current_assignments) - kept}, removed {removed}")
+
 def countDataSets():
     # Find all datasets (folders containing images and labels)
     dataset_folders = []
@@ -80,14 +525,14 @@ def countDataSets():
 
 def countDataSetsManual():
     global train_images, test_images, total_images
+    index = fsindex.get_index(parent_dir)
 
     if(flagDSManual): 
         print("Train Dataset Image Counts:")
         print("---------------------------")
     for name in train_folders:
-        images_path = os.path.join(parent_dir, name, "images")
-        if os.path.exists(images_path):
-            image_count = len([f for f in os.listdir(images_path) if f.endswith(image_exts)])
+        if index.has_folder(name, "images"):
+            image_count = len(index.images(name, image_exts))
             if(flagDSManual): print(f"{name}: {image_count} images")
             train_images += image_count
         else:
@@ -97,9 +542,8 @@ def countDataSetsManual():
         print("\nTest Dataset Image Counts:")
         print("--------------------------")
     for name in test_folders:
-        images_path = os.path.join(parent_dir, name, "images")
-        if os.path.exists(images_path):
-            image_count = len([f for f in os.listdir(images_path) if f.endswith(image_exts)])
+        if index.has_folder(name, "images"):
+            image_count = len(index.images(name, image_exts))
             if(flagDSManual): print(f"{name}: {image_count} images")
             test_images += image_count
         else:
@@ -122,7 +566,11 @@ def countWishDataSet():
         print(f"Wish Test Images: {wishTest_images}")
         print(f"Wish Total Images: {wishTotal_images}")
     if(wishTest_images > test_images):
-        input(f"ERROR: Test Images cannot fulfill Wish Images: {wishTest_images}")
+        message = f"ERROR: Test Images cannot fulfill Wish Images: {wishTest_images}"
+        if flagInteractive:
+            input(message)
+        else:
+            print(message)
         sys.exit(1)  # Exit with error code 1
 
 def countFinalDataSet():
@@ -133,7 +581,8 @@ def countFinalDataSet():
         print(f"True Training Images: {train_images}")
         print(f"Wish Test Images: {wishTest_images}")
         print(f"Final Total Images: {wishTotal_images}")
-    input("Press Enter to Split Dataset...")
+    if flagInteractive:
+        input("Press Enter to Split Dataset...")
 
 def calculateTempRatio():
     print("----------------------")
@@ -147,51 +596,80 @@ def splitTrainAndVal():
     global base_dir, train_images, test_images, total_images, wishTest_images, test_images, wishTotal_images, final_train, final_val, final_test, final_total
     image_exts = ('.jpg', '.jpeg', '.png')
 
-    # Output structure
-    output_dirs = {
-        "train_images": os.path.join(base_dir, "images/train"),
-        "val_images": os.path.join(base_dir, "images/val"),
-        "train_labels": os.path.join(base_dir, "labels/train"),
-        "val_labels": os.path.join(base_dir, "labels/val"),
-    }
-
-    # Create output folders
-    for path in output_dirs.values():
-        os.makedirs(path, exist_ok=True)
-
-    # Gather all image-label pairs from train_folders
+    # Gather all image-label pairs from train_folders (label None = missing)
+    index = fsindex.get_index(parent_dir)
     all_image_paths = []
     for folder in train_folders:
         images_path = os.path.join(folder, "images")
         labels_path = os.path.join(folder, "labels")
-        if os.path.exists(images_path) and os.path.exists(labels_path):
-            for fname in os.listdir(images_path):
-                if fname.endswith(image_exts):
-                    image_file = os.path.join(images_path, fname)
-                    label_file = os.path.join(labels_path, os.path.splitext(fname)[0] + ".txt")
-                    all_image_paths.append((image_file, label_file))
+        if index.has_folder(folder, "images") and index.has_folder(folder, "labels"):
+            for fname in index.images(folder, image_exts):
+                image_file = os.path.join(images_path, fname)
+                label_file = os.path.join(labels_path, os.path.splitext(fname)[0] + ".txt")
+                all_image_paths.append((image_file, label_file if index.has_label(folder, fname) else None))
         else:
             print(f"Warning: Skipping folder '{folder}' due to missing 'images' or 'labels'.")
 
-    # Shuffle and split
-    random.shuffle(all_image_paths)
+    all_image_paths = exclude_flagged(all_image_paths)
     total = len(all_image_paths)
-    train_count = int(total * tempTrainRatio)
-
-    train_data = all_image_paths[:train_count]
-    val_data = all_image_paths[train_count:]
-
-    # Copy to new structure with progress bar
-    def copy_to_split(pairs, img_dest, lbl_dest, desc):
-        for img_src, lbl_src in tqdm(pairs, desc=desc):
-            shutil.copy2(img_src, os.path.join(img_dest, os.path.basename(img_src)))
-            if os.path.exists(lbl_src):
-                shutil.copy2(lbl_src, os.path.join(lbl_dest, os.path.basename(lbl_src)))
-            else:
-                print(f"Missing label for {img_src}")
-
-    copy_to_split(train_data, output_dirs["train_images"], output_dirs["train_labels"], "Copying Train")
-    copy_to_split(val_data, output_dirs["val_images"], output_dirs["val_labels"], "Copying Val")
+    if flagIncremental:
+        # Earlier assignments stay; new images go by seeded path hash at the train/val ratio
+        previous_assignments.update(load_split_manifest())
+        train_data, val_data = [], []
+        for pair in all_image_paths:
+            key = source_key(pair[0])
+            split = previous_assignments.get(key)
+            if split not in ("train", "val"):
+                split = "train" if stable_score(assignment_key(pair[0])) < tempTrainRatio else "val"
+            current_assignments[key] = split
+            (train_data if split == "train" else val_data).append(pair)
+    elif split_strategy == "group":
+        train_data, val_data = assign_groups(all_image_paths, [tempTrainRatio, tempValRatio])
+    else:
+        # Shuffle and split
+        random.shuffle(all_image_paths)
+        train_count = int(total * tempTrainRatio)
+
+        train_data = all_image_paths[:train_count]
+        val_data = all_image_paths[train_count:]
+
+    if flagResize and output_mode != "manifest":
+        resizeImages(train_data + val_data)
+
+    if output_mode == "manifest":
+        for split, pairs in (("train", train_data), ("val", val_data)):
+            for img_src in write_manifest(split, pairs):
+                metrics.warn("missing label", img_src)
+    elif output_mode == "shards":
+        for split, pairs in (("train", train_data), ("val", val_data)):
+            for img_src in write_shards(split, pairs):
+                metrics.warn("missing label", img_src)
+    else:
+        # Output structure
+        output_dirs = {
+            "train_images": os.path.join(base_dir, "images/train"),
+            "val_images": os.path.join(base_dir, "images/val"),
+            "train_labels": os.path.join(base_dir, "labels/train"),
+            "val_labels": os.path.join(base_dir, "labels/val"),
+        }
+
+        # Create output folders
+        for path in output_dirs.values():
+            os.makedirs(path, exist_ok=True)
+
+        # Copy to new structure with progress bar
+        def copy_to_split(pairs, img_dest, lbl_dest, desc):
+            jobs = [(resized_sources.get(img_src, img_src), os.path.join(img_dest, os.path.basename(img_src)),
+                     lbl_src, os.path.join(lbl_dest, os.path.splitext(os.path.basename(img_src))[0] + ".txt"))
+                    for img_src, lbl_src in pairs]
+            for img_src in copy_pairs(jobs, desc):
+                metrics.warn("missing label", img_src)
+
+        copy_to_split(pending_pairs("train", train_data), output_dirs["train_images"], output_dirs["train_labels"], "Copying Train")
+        copy_to_split(pending_pairs("val", val_data), output_dirs["val_images"], output_dirs["val_labels"], "Copying Val")
+
+    if split_strategy == "group":
+        train_stems.update(stems.source_stem(os.path.basename(img_src)) for img_src, _ in all_image_paths)
 
     # save to final
     final_total += total
@@ -203,42 +681,70 @@ def splitTest():
 
     global base_dir, train_images, test_images, total_images, wishTest_images, test_images, wishTotal_images, final_train, final_val, final_test, final_total
 
-    # Output directories
-    dest_img_test = os.path.join(base_dir, "images", "test")
-    dest_lbl_test = os.path.join(base_dir, "labels", "test")
-    os.makedirs(dest_img_test, exist_ok=True)
-    os.makedirs(dest_lbl_test, exist_ok=True)
-
     # Collect all available image paths from test folders
+    index = fsindex.get_index(parent_dir)
     all_image_paths = []
     for folder in test_folders:
-        img_dir = os.path.join(parent_dir, folder, "images")
-        if os.path.exists(img_dir):
-            image_files = [f for f in os.listdir(img_dir) if f.endswith(image_exts)]
-            all_image_paths.extend([(folder, f) for f in image_files])
+        if index.has_folder(folder, "images"):
+            all_image_paths.extend([(folder, f) for f in index.images(folder, image_exts)])
         else:
             print(f"Warning: {folder}/images not found.")
 
-    # Shuffle and select desired number
-    random.shuffle(all_image_paths)
-    selected = all_image_paths[:min(wishTest_images, len(all_image_paths))]
-
-    # Copy files
-    for folder, img_file in tqdm(selected, desc="Copying test data"):
-        src_img_path = os.path.join(parent_dir, folder, "images", img_file)
-        src_lbl_path = os.path.join(parent_dir, folder, "labels", os.path.splitext(img_file)[0] + ".txt")
-
-        # Copy image
-        shutil.copy2(src_img_path, os.path.join(dest_img_test, img_file))
-
-        # Copy label if exists
-        if os.path.exists(src_lbl_path):
-            shutil.copy2(src_lbl_path, os.path.join(dest_lbl_test, os.path.basename(src_lbl_path)))
-        else:
-            print(f"⚠️ Label not found for image {img_file} in {folder}")
-
-    input("Press Enter to continue...")
-    final_test = len(selected)
+    if split_strategy == "group":
+        candidates = [(folder, f) for folder, f in all_image_paths if stems.source_stem(f) not in train_stems]
+        if len(candidates) < len(all_image_paths):
+            print(f"Excluded {len(all_image_paths) - len(candidates)} test images whose source stem is also in train/val")
+        all_image_paths = candidates
+
+    all_pairs = [(os.path.join(parent_dir, folder, "images", img_file),
+                  os.path.join(parent_dir, folder, "labels", os.path.splitext(img_file)[0] + ".txt")
+                  if index.has_label(folder, img_file) else None)
+                 for folder, img_file in all_image_paths]
+    all_pairs = exclude_flagged(all_pairs)
+    wish = min(wishTest_images, len(all_pairs))
+    if flagIncremental:
+        # Keep earlier test images that still exist, then top up (or trim) to the wish count by seeded hash
+        ranked = sorted(all_pairs, key=lambda pair: (stable_score(assignment_key(pair[0])), pair[0]))
+        kept = [pair for pair in ranked if previous_assignments.get(source_key(pair[0])) == "test"]
+        fresh = [pair for pair in ranked if previous_assignments.get(source_key(pair[0])) != "test"]
+        pairs = (kept + fresh)[:wish]
+    elif split_strategy == "group" and all_pairs:
+        # Whole groups, class-stratified, as close to the wish count as group sizes allow
+        pairs, _ = assign_groups(all_pairs, [wish / len(all_pairs), 1 - wish / len(all_pairs)])
+    else:
+        # Shuffle and select desired number
+        random.shuffle(all_pairs)
+        pairs = all_pairs[:wish]
+
+    if flagIncremental:
+        current_assignments.update((source_key(img_src), "test") for img_src, _ in pairs)
+
+    if flagResize and output_mode != "manifest":
+        resizeImages(pairs)
+
+    if output_mode == "manifest":
+        for src_img_path in write_manifest("test", pairs):
+            metrics.warn("missing label", src_img_path)
+    elif output_mode == "shards":
+        for src_img_path in write_shards("test", pairs):
+            metrics.warn("missing label", src_img_path)
+    else:
+        # Output directories
+        dest_img_test = os.path.join(base_dir, "images", "test")
+        dest_lbl_test = os.path.join(base_dir, "labels", "test")
+        os.makedirs(dest_img_test, exist_ok=True)
+        os.makedirs(dest_lbl_test, exist_ok=True)
+
+        # Copy files (image + label if exists)
+        jobs = [(resized_sources.get(img_src, img_src), os.path.join(dest_img_test, os.path.basename(img_src)),
+                 lbl_src, os.path.join(dest_lbl_test, os.path.splitext(os.path.basename(img_src))[0] + ".txt"))
+                for img_src, lbl_src in pending_pairs("test", pairs)]
+        for src_img_path in copy_pairs(jobs, "Copying test data"):
+            metrics.warn("missing label", src_img_path)
+
+    if flagInteractive:
+        input("Press Enter to continue...")
+    final_test = len(pairs)
     final_total += final_test
 
 def showResults():
@@ -247,11 +753,40 @@ def showResults():
     print(f"Val Set:{final_val}")
     print(f"Test Set:{final_test}")
     print(f"Total:{final_total}")
-
-
-countDataSetsManual()
-countWishDataSet()
-countFinalDataSet()
-splitTrainAndVal()
-splitTest()
-showResults()
\ No newline at end of file
+    if flagResize and output_mode != "manifest":
+        print(f"Resized to {resize_max_side}px: {len(resized_sources)} images, {bytes_saved / (1024 * 1024):.1f} MB saved")
+    if output_mode == "manifest":
+        print(f"Manifests written: {os.path.join(base_dir, 'data.yaml')} (train.txt, val.txt, test.txt)")
+        return
+    if output_mode == "shards":
+        print(f"Shards written: {os.path.join(base_dir, 'shards')} ({shard_size} samples per shard, index.json)")
+        print(f"Bytes written: {bytes_written / (1024 * 1024):.1f} MB")
+        if copy_seconds > 0:
+            print(f"Throughput: {bytes_written / copy_seconds / (1024 * 1024):.1f} MB/s ({shard_workers} writers)")
+        return
+    methods = ", ".join(f"{method}: {count}" for method, count in materialize_counts.items())
+    print(f"Files placed ({materialize_mode} mode) - {methods or 'none'}")
+    print(f"Bytes written: {bytes_written / (1024 * 1024):.1f} MB")
+    if copy_seconds > 0:
+        print(f"Throughput: {files_placed / copy_seconds:.0f} files/s, {bytes_written / copy_seconds / (1024 * 1024):.1f} MB/s ({copy_workers} workers)")
+
+def run():
+    if flagPreflight or flagIntegrity:
+        with metrics.stage("checks"):
+            runChecks()
+    with metrics.stage("count"):
+        countDataSetsManual()
+        countWishDataSet()
+        countFinalDataSet()
+    with metrics.stage("split_train_val"):
+        splitTrainAndVal()
+    with metrics.stage("split_test"):
+        splitTest()
+    if flagIncremental:
+        with metrics.stage("remove_stale"):
+            removeStaleOutputs()
+    showResults()
+
+if __name__ == "__main__":
+    run()
+    metrics.report()
\ No newline at end of file
@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+'''
+Benchmark harness for the cleaning scripts.
+
+usage: python bench.py [--sizes 250 1000 4000] [--stages dedup_hash split] [--save-baseline]
+
+For every size (images per dataset) a synthetic YOLO tree is generated, then each stage runs in its own child
+process so peak RSS and bytes written are measured per stage:
+
+dedup_prefix   DuplicateCheck.find_duplicates(), match_mode "prefix", first dataset as base
+dedup_stem     DuplicateCheck.find_duplicates(), match_mode "stem" (stem_match "prefix"), first dataset as base
+dedup_hash     DuplicateCheck.find_duplicates_global(), match_mode "hash" (cold digest cache)
+classfix_scan  classfix.scan() (label store build)
+classfix_fix   classfix.fix() (force class 0; rewrites every label with another class)
+split          Split.run(), last dataset as test folder, materialize_mode "copy"
+
+Results go to bench_results/bench_results.json. With --save-baseline they become the baseline; otherwise they are compared
+against it and a drop in files/s or growth in peak RSS beyond `tolerance` is reported as a regression
+(exit code 1).
+'''
+
+# === CONFIGURABLE ===
+sizes = [250, 1000, 4000]  # Images per dataset, one synthetic tree per size
+num_datasets = 4  # The last one is used as the Split.py test folder
+dup_rate = 0.1  # Share of images (outside the first dataset) that are exact copies of an earlier dataset's image
+boxes_per_label = 3
+num_classes = 4
+flagRoboflowNames = True  # "<stem>_jpg.rf.<32 hex>.jpg" filenames, as exported by Roboflow
+image_size = (64, 48)  # Pixel size of the generated JPEGs (kept small so generation is not the bottleneck)
+seed = 0
+stages = ["dedup_prefix", "dedup_stem", "dedup_hash", "classfix_scan", "classfix_fix", "split"]
+bench_dir = None  # Where trees are generated; None = a temporary directory, removed afterwards
+results_dir = "bench_results"  # Holds the results and baseline files (git-ignored, so the baseline stays local)
+results_file = os.path.join(results_dir, "bench_results.json")
+baseline_file = os.path.join(results_dir, "bench_baseline.json")
+tolerance = 0.2  # Allowed relative slowdown (files/s) or memory growth (peak RSS) before flagging a regression
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# === SYNTHETIC TREES ===
+def image_bytes(rng):
+    """Encoded bytes of one random-noise JPEG (random bytes between JPEG markers if Pillow is missing)."""
+    try:
+        from io import BytesIO
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + bytes(rng.getrandbits(8) for _ in range(2048)) + b"\xff\xd9"
+    width, height = image_size
+    img = Image.frombytes("L", (width, height), bytes(rng.getrandbits(8) for _ in range(width * height)))
+    buffer = BytesIO()
+    img.convert("RGB").save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def image_name(rng, dataset_index, i):
+    if flagRoboflowNames:
+        return f"photo-{dataset_index}-{i:06d}_jpg.rf.{rng.getrandbits(128):032x}.jpg"
+    return f"img_{dataset_index}_{i:06d}.jpg"
+
+def label_text(rng):
+    lines = []
+    for _ in range(boxes_per_label):
+        w, h = rng.uniform(0.02, 0.4), rng.uniform(0.02, 0.4)
+        cx, cy = rng.uniform(w / 2, 1 - w / 2), rng.uniform(h / 2, 1 - h / 2)
+        lines.append(f"{rng.randrange(num_classes)} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}")
+    return "\n".join(lines) + "\n"
+
+def generate_tree(root, images_per_dataset):
+    """Writes num_datasets dataset folders (images + labels) under root; returns their names and file counts."""
+    rng = random.Random(seed)
+    datasets = [f"ds{i}" for i in range(num_datasets)]
+    written = []  # (image bytes, label text) already placed, sources for duplicates
+    duplicates = 0
+    for d, name in enumerate(datasets):
+        os.makedirs(os.path.join(root, name, "images"), exist_ok=True)
+        os.makedirs(os.path.join(root, name, "labels"), exist_ok=True)
+        produced = []
+        for i in range(images_per_dataset):
+            if d > 0 and written and rng.random() < dup_rate:
+                data, label = rng.choice(written)
+                duplicates += 1
+            else:
+                data, label = image_bytes(rng), label_text(rng)
+            stem = os.path.splitext(image_name(rng, d, i))[0]
+            with open(os.path.join(root, name, "images", stem + ".jpg"), "wb") as f:
+                f.write(data)
+            with open(os.path.join(root, name, "labels", stem + ".txt"), "w") as f:
+                f.write(label)
+            produced.append((data, label))
+        written.extend(produced)
+    total = num_datasets * images_per_dataset
+    return {"datasets": datasets, "images": total, "labels": total, "duplicates": duplicates}
+
+# === STAGES (run inside the child process, cwd = tree root) ===
+def stage_dedup_prefix(root, datasets):
+    import DuplicateCheck
+    DuplicateCheck.cwd = root
+    DuplicateCheck.match_mode = "prefix"
+    DuplicateCheck.flagShowMatches = False
+    DuplicateCheck.dataset_selection(datasets[0])
+    DuplicateCheck.find_duplicates()
+
+def stage_dedup_stem(root, datasets):
+    import DuplicateCheck
+    DuplicateCheck.cwd = root
+    DuplicateCheck.match_mode = "stem"
+    DuplicateCheck.stem_match = "prefix"
+    DuplicateCheck.flagShowMatches = False
+    DuplicateCheck.dataset_selection(datasets[0])
+    DuplicateCheck.find_duplicates()
+
+def stage_dedup_hash(root, datasets):
+    import DuplicateCheck
+    DuplicateCheck.cwd = root
+    DuplicateCheck.match_mode = "hash"
+    DuplicateCheck.flagShowMatches = False
+    DuplicateCheck.datasets = DuplicateCheck.find_datasets()
+    DuplicateCheck.find_duplicates_global()
+
+def stage_classfix_scan(root, datasets):
+    import classfix
+    classfix.scan(root)
+
+def stage_classfix_fix(root, datasets):
+    import classfix
+    classfix.fix(root)
+
+def stage_split(root, datasets):
+    import Split
+    Split.parent_dir = root
+    Split.base_dir = os.path.join(root, "Finaldata")
+    Split.train_folders = datasets[:-1]
+    Split.test_folders = datasets[-1:]
+    Split.materialize_mode = "copy"
+    Split.flagInteractive = False
+    Split.run()
+
+STAGES = {
+    "dedup_prefix": (stage_dedup_prefix, "images"),
+    "dedup_stem": (stage_dedup_stem, "images"),
+    "dedup_hash": (stage_dedup_hash, "images"),
+    "classfix_scan": (stage_classfix_scan, "labels"),
+    "classfix_fix": (stage_classfix_fix, "labels"),
+    "split": (stage_split, "images"),
+}
+
+def write_bytes():
+    """Bytes this process caused to be written to storage (Linux /proc/self/io); None elsewhere."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+def peak_rss_mb():
+    """Peak RSS of this process and its finished pool workers in MB; None where resource is unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
+
+def run_stage_child(stage, root, datasets, result_path):
+    sys.path.insert(0, SCRIPT_DIR)
+    os.chdir(root)
+    import DuplicateCheck, classfix, Split  # imported up front so module load time is not counted in the stage
+    written_before = write_bytes()
+    start = time.perf_counter()
+    STAGES[stage][0](root, datasets)
+    seconds = time.perf_counter() - start
+    written_after = write_bytes()
+    result = {
+        "seconds": seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        "bytes_written": written_after - written_before if written_before is not None else None,
+    }
+    with open(result_path, "w") as f:
+        json.dump(result, f)
+
+def run_stage(stage, root, tree):
+    """Runs one stage in a fresh interpreter; returns its measurements (None if the stage failed)."""
+    fd, result_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        command = [sys.executable, os.path.abspath(__file__), "--child", stage, "--root", root,
+                   "--datasets", ",".join(tree["datasets"]), "--result", result_path]
+        proc = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+        if proc.returncode != 0:
+            error = proc.stderr.decode(errors="replace").strip().splitlines()
+            print(f"  {stage}: FAILED (exit {proc.returncode}) {error[-1] if error else ''}")
+            return None
+        with open(result_path, "r") as f:
+            result = json.load(f)
+    finally:
+        os.remove(result_path)
+    result["files"] = tree[STAGES[stage][1]]
+    result["files_per_s"] = result["files"] / result["seconds"] if result["seconds"] else None
+    return result
+
+# === REPORTING ===
+def format_row(key, result, baseline=None):
+    rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+    written = f"{result['bytes_written'] / (1 << 20):.1f} MB" if result["bytes_written"] is not None else "n/a"
+    row = f"{key:<22} {result['seconds']:>8.2f} s {result['files_per_s']:>10.0f} files/s {rss:>8} {written:>10}"
+    if baseline:
+        row += f"   ({result['files_per_s'] / baseline['files_per_s'] - 1:+.0%} files/s vs baseline)"
+    return row
+
+def compare(results, baseline):
+    """Keys of stages that got slower or hungrier than the baseline allows."""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if not old or result is None:
+            continue
+        slower = result["files_per_s"] < old["files_per_s"] * (1 - tolerance)
+        hungrier = (result["peak_rss_mb"] is not None and old.get("peak_rss_mb")
+                    and result["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance))
+        if slower or hungrier:
+            regressions.append(key)
+    return regressions
+
+def main(argv=None):
+    global sizes, stages
+    parser = argparse.ArgumentParser(prog="bench.py", description="Benchmark the cleaning scripts on synthetic trees.")
+    parser.add_argument("--sizes", type=int, nargs="+", help=f"images per dataset (default: {sizes})")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), help="stages to run (default: all)")
+    parser.add_argument("--save-baseline", action="store_true", help=f"store the results as {baseline_file}")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    parser.add_argument("--datasets", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_stage_child(args.child, args.root, args.datasets.split(","), args.result)
+        return 0
+    sizes = args.sizes or sizes
+    stages = args.stages or stages
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(baseline_file):
+        with open(baseline_file, "r") as f:
+            baseline = json.load(f)
+
+    work_dir = bench_dir or tempfile.mkdtemp(prefix="bench_")
+    results = {}
+    try:
+        for size in sizes:
+            root = os.path.join(work_dir, f"tree_{size}")
+            if os.path.exists(root):
+                shutil.rmtree(root)
+            start = time.perf_counter()
+            tree = generate_tree(root, size)
+            print(f"\nTree {size}/dataset: {tree['images']} images, {tree['duplicates']} duplicates "
+                  f"(generated in {time.perf_counter() - start:.1f} s)")
+            for stage in stages:
+                key = f"{stage}@{size}"
+                results[key] = run_stage(stage, root, tree)
+                if results[key] is not None:
+                    print("  " + format_row(key, results[key], baseline.get(key)))
+    finally:
+        if bench_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    os.makedirs(results_dir, exist_ok=True)
+    with open(results_file, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"\nResults saved as: {results_file}")
+    if args.save_baseline:
+        with open(baseline_file, "w") as f:
+            json.dump({key: result for key, result in results.items() if result is not None}, f, indent=4)
+        print(f"Baseline saved as: {baseline_file}")
+        return 0
+
+    regressions = compare(results, baseline)
+    if regressions:
+        print(f"\nREGRESSIONS (beyond {tolerance:.0%} of {baseline_file}):")
+        for key in regressions:
+            print(f"- {key}")
+        return 1
+    if baseline:
+        print(f"No regressions against {baseline_file}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
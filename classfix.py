@@ -1,74 +1,309 @@
 import os
 import json
-from collections import defaultdict
+import math
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+import fsindex
+import labelstore
+import metrics
+import numpy as np
 
 LOG_FILE = "label_scan_log.json"
 
-log_path = "class_scan_log.json"
+journal_path = "classfix_journal.txt"  # Paths finished by fix(); lets an interrupted run resume where it stopped
+workers = 8  # Label files parsed/rewritten concurrently
+flagFsync = False  # fsync each rewritten file before the rename (survives power loss, slower)
+
+# === Class remap ===
+class_map = {}  # old class id -> new class id, or None to drop those boxes
+unmapped_class = 0  # ids missing from class_map: a new id, None (drop) or "keep"; 0 = force every class to 0
+empty_action = "keep"  # label files left without boxes: "keep" (empty label) or "drop_image" (delete label + image)
+image_exts = ('.jpg', '.jpeg', '.png')
+
+# === Box validation ===
+box_eps = 1e-6  # Tolerance for the [0, 1] range and zero-area checks
+issues_path = "label_issues.json"  # Per-file issue report written by validate()
 
 def scan(base_dir="."):
-    class_counts = {}
-    file_class_map = {}
-
-    # Collect all label files first
-    label_files = []
-    for root, _, files in os.walk(base_dir):
-        for file in files:
-            if file.endswith(".txt") and "labels" in root:
-                label_files.append(os.path.join(root, file))
-
-    # Scan with tqdm
-    for label_path in tqdm(label_files, desc="Scanning label files", unit="file"):
-        with open(label_path, "r") as f:
-            lines = f.readlines()
-
-        found_classes = []
-        for line in lines:
-            parts = line.strip().split()
-            if parts:
-                class_id = parts[0]
-                found_classes.append(class_id)
-                class_counts[class_id] = class_counts.get(class_id, 0) + 1
-
-        if found_classes:
-            file_class_map[label_path] = found_classes
-
-    log_data = {
-        "class_counts": class_counts,
-        "file_class_map": file_class_map
+    """Builds/updates the columnar label store (only changed files are parsed) and prints per-class box counts."""
+    store = labelstore.build_store(base_dir)
+
+    class_counts = store.class_counts()
+    files_with_boxes = len(set(store.file_ids.tolist()))
+    print("Class counts:")
+    for class_id, count in sorted(class_counts.items()):
+        print(f"- class {class_id}: {count} boxes")
+    print(f" Scan complete. {files_with_boxes} label files with boxes; store saved to '{labelstore.store_dir}'.")
+    return store
+
+def box_issues(store):
+    """Boolean masks over every box in the store, one per check."""
+    class_ids = np.asarray(store.class_ids)
+    file_ids = np.asarray(store.file_ids)
+    boxes = np.asarray(store.boxes, dtype=np.float64)
+    cx, cy, w, h = boxes.T if len(boxes) else np.zeros((4, 0))
+
+    finite = np.isfinite(boxes).all(axis=1) if len(boxes) else np.zeros(0, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        out_of_range = finite & ((boxes < -box_eps).any(axis=1) | (boxes > 1 + box_eps).any(axis=1)
+                                 | (cx - w / 2 < -box_eps) | (cx + w / 2 > 1 + box_eps)
+                                 | (cy - h / 2 < -box_eps) | (cy + h / 2 > 1 + box_eps))
+        degenerate = finite & ((w <= box_eps) | (h <= box_eps))
+
+    # Exact duplicates: sort rows by (file, class, box) and flag every row equal to its predecessor
+    duplicate = np.zeros(len(boxes), dtype=bool)
+    if len(boxes) > 1:
+        order = np.lexsort((boxes[:, 3], boxes[:, 2], boxes[:, 1], boxes[:, 0], class_ids, file_ids))
+        rows = np.column_stack((file_ids, class_ids, boxes))[order]
+        duplicate[order[1:]] = (rows[1:] == rows[:-1]).all(axis=1)
+
+    return {
+        "nan": ~finite,
+        "negative_class": class_ids < 0,
+        "out_of_range": out_of_range,
+        "degenerate": degenerate,
+        "duplicate": duplicate,
     }
 
-    with open(log_path, "w") as f:
-        json.dump(log_data, f, indent=4)
+def fix_box_lines(lines):
+    """Line-level autofix matching validate()'s checks: drop malformed, non-finite, degenerate and duplicate
+    boxes, clip the rest to the image. Lines that need no change are kept verbatim."""
+    new_lines = []
+    seen = set()
+    for line in lines:
+        parts = line.split()
+        if not parts:
+            continue
+        if len(parts) != 5:
+            continue
+        try:
+            cls = int(parts[0])
+            cx, cy, w, h = (float(x) for x in parts[1:])
+        except ValueError:
+            continue
+        if cls < 0 or not all(math.isfinite(v) for v in (cx, cy, w, h)):
+            continue
+
+        x1, y1 = max(cx - w / 2, 0.0), max(cy - h / 2, 0.0)
+        x2, y2 = min(cx + w / 2, 1.0), min(cy + h / 2, 1.0)
+        clipped = (cx - w / 2 < -box_eps or cy - h / 2 < -box_eps or cx + w / 2 > 1 + box_eps or cy + h / 2 > 1 + box_eps)
+        if clipped:
+            cx, cy, w, h = (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1
+        if w <= box_eps or h <= box_eps:
+            continue
+
+        key = (cls, np.float32(cx), np.float32(cy), np.float32(w), np.float32(h))
+        if key in seen:
+            continue
+        seen.add(key)
+        new_lines.append(f"{cls} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}" if clipped else line.strip())
+    return new_lines
+
+def validate(base_dir=".", autofix=False):
+    """Checks every box at once (NaN, negative class, out of range, zero area, exact duplicates, malformed lines)
+    and writes a per-file report to issues_path; autofix=True rewrites only the files with issues."""
+    store = labelstore.build_store(base_dir)
+    with metrics.stage("validate"):
+        checks = box_issues(store)
+        metrics.count("files", len(store.paths))
+    file_ids = np.asarray(store.file_ids)
+    bad_lines = np.asarray(store.bad_lines, dtype=np.int64)
+
+    per_check = {name: np.bincount(file_ids[mask], minlength=len(store.paths)) for name, mask in checks.items()}
+    per_check["malformed"] = bad_lines
+    flagged = np.zeros(len(store.paths), dtype=bool)
+    for counts in per_check.values():
+        flagged |= counts > 0
+
+    report = {}
+    for file_id in np.flatnonzero(flagged):
+        report[store.paths[file_id]] = {name: int(counts[file_id]) for name, counts in per_check.items() if counts[file_id]}
+    with open(issues_path, "w") as f:
+        json.dump(report, f, indent=4)
+
+    print("Label validation:")
+    for name, counts in per_check.items():
+        print(f"- {name}: {int(counts.sum())} boxes/lines in {int((counts > 0).sum())} files")
+    print(f"{len(report)} of {len(store.paths)} label files have issues. Report saved to '{issues_path}'.")
+
+    if autofix and report:
+        fix(base_dir, fix_box_lines, f"validate-autofix-{box_eps}", [store.abs_path(i) for i in np.flatnonzero(flagged)])
+    return report
+
+def force_class_zero(lines):
+    new_lines = []
+    for line in lines:
+        parts = line.strip().split()
+        if parts:
+            parts[0] = "0"  # Force class to 0
+            new_lines.append(" ".join(parts))
+    return new_lines
+
+def remap_class(class_token):
+    """New class token for an old one, or None to drop the box."""
+    try:
+        old = int(class_token)
+    except ValueError:
+        old = None
+    new = class_map[old] if old in class_map else unmapped_class
+    if new == "keep":
+        return class_token
+    return None if new is None else str(new)
+
+def remap_lines(lines):
+    new_lines = []
+    for line in lines:
+        parts = line.strip().split()
+        if parts:
+            new_class = remap_class(parts[0])
+            if new_class is not None:
+                parts[0] = new_class
+                new_lines.append(" ".join(parts))
+    return new_lines
+
+def write_atomic(file_path, text):
+    """Writes text to a temp file next to file_path and renames it over the original."""
+    directory = os.path.dirname(file_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(file_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            if flagFsync:
+                f.flush()
+                os.fsync(f.fileno())
+                metrics.count("fsync")
+        try:
+            os.chmod(tmp_path, os.stat(file_path).st_mode & 0o7777)
+        except OSError:
+            pass
+        os.replace(tmp_path, file_path)
+        metrics.count("rename")
+        metrics.count("bytes_written", len(text))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def rewrite_label(file_path, transform):
+    """Applies transform(lines) -> new lines; returns True if the file changed (unchanged files are not written)."""
+    with open(file_path, "r") as f:
+        text = f.read()
+    metrics.count("bytes_read", len(text))
+    lines = text.splitlines()
+    if not any(line.strip() for line in lines):
+        return False
+
+    new_lines = transform(lines)
+    new_text = "\n".join(new_lines) + "\n" if new_lines else ""
+    if new_text == text:
+        return False
+    write_atomic(file_path, new_text)
+    return True
+
+def load_journal(signature):
+    """Returns paths already handled by an interrupted run with the same transform, else an empty set."""
+    if not os.path.exists(journal_path):
+        return set()
+    with open(journal_path, "r") as f:
+        lines = f.read().splitlines()
+    if not lines or lines[0] != f"# {signature}":
+        print(f"Ignoring journal '{journal_path}' written for a different fix.")
+        return set()
+    print(f"Resuming from journal '{journal_path}' ({len(lines) - 1} files already done).")
+    return set(lines[1:])
+
+def fix(base_dir=".", transform=force_class_zero, signature="force-class-0", label_files=None):
+    """Streams label files (default: all) through transform on a worker pool, rewriting changed files atomically.
+
+    Finished paths are appended to journal_path as they complete; the journal is removed once the run finishes.
+    """
+    if label_files is None:
+        label_files = fsindex.get_index(base_dir).label_files()
+    done = load_journal(signature)
+    pending = [path for path in label_files if path not in done]
+
+    fixed = 0
+    skipped = 0
+    with open(journal_path, "a" if done else "w") as journal:
+        if not done:
+            journal.write(f"# {signature}\n")
+        with metrics.stage("rewrite"), ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(rewrite_label, path, transform): path for path in pending}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Fixing label files", unit="file"):
+                metrics.count("files")
+                if future.result():
+                    fixed += 1
+                else:
+                    skipped += 1
+                journal.write(futures[future] + "\n")
+                journal.flush()
+    os.remove(journal_path)
+    if fixed:
+        fsindex.get_index(base_dir, refresh=True)  # later stages read the new label sizes/mtimes
+
+    print(f"Fix complete. {fixed} files rewritten, {skipped} already correct.")
 
-    print(f" Scan complete. Results saved to '{log_path}'.")
+def remap(base_dir="."):
+    """Applies class_map to every box: one vectorised pass over the label store picks the files to rewrite and
+    counts changes per class, then only those files go through the same line-level rewrite as fix()."""
+    store = labelstore.build_store(base_dir)
+    settings = json.dumps([sorted((str(k), v) for k, v in class_map.items()), unmapped_class])
+    signature = "remap-" + hashlib.sha1(settings.encode()).hexdigest()[:12]
 
-def fix():
-    if not os.path.exists(log_path):
-        print("No scan log found. Run scan() first.")
-        return
+    class_ids = np.asarray(store.class_ids)
+    file_ids = np.asarray(store.file_ids)
+    new_ids = class_ids.astype(np.int64)
+    if len(class_ids):
+        lo = int(class_ids.min())
+        lut = np.array([-1 if remap_class(str(cls)) is None else int(remap_class(str(cls)))
+                        for cls in range(lo, int(class_ids.max()) + 1)], dtype=np.int64)
+        new_ids = lut[class_ids - lo]
 
-    with open(log_path, "r") as f:
-        log_data = json.load(f)
+    dropped = new_ids < 0
+    changed = ~dropped & (new_ids != class_ids)
+    bad_lines = np.asarray(store.bad_lines, dtype=np.int64)
+    touched = np.zeros(len(store.paths), dtype=bool)
+    touched[file_ids[changed | dropped]] = True
+    touched |= bad_lines > 0  # malformed lines still go through the line-level rewrite
+    boxes_before = np.bincount(file_ids, minlength=len(store.paths))
+    boxes_after = np.bincount(file_ids[~dropped], minlength=len(store.paths))
+    emptied = (boxes_before > 0) & (boxes_after == 0) & (bad_lines == 0)
 
-    file_class_map = log_data.get("file_class_map", {})
+    print("Class remap:")
+    if len(class_ids):
+        changed_counts = np.bincount(class_ids[changed] - lo, minlength=len(lut))
+        dropped_counts = np.bincount(class_ids[dropped] - lo, minlength=len(lut))
+        for cls, total in sorted(store.class_counts().items()):
+            target = f" -> {lut[cls - lo]}" if changed_counts[cls - lo] else ""
+            print(f"- class {cls}: {total} boxes, {changed_counts[cls - lo]} changed{target}, {dropped_counts[cls - lo]} dropped")
 
-    for file_path in tqdm(file_class_map, desc="Fixing label files", unit="file"):
-        new_lines = []
-        with open(file_path, "r") as f:
-            for line in f:
-                parts = line.strip().split()
-                if parts:
-                    parts[0] = "0"  # Force class to 0
-                    new_lines.append(" ".join(parts))
+    fix(base_dir, remap_lines, signature, [store.abs_path(i) for i in np.flatnonzero(touched)])
 
-        with open(file_path, "w") as f:
-            f.write("\n".join(new_lines) + "\n")
+    if empty_action == "drop_image":
+        index = fsindex.get_index(base_dir)
+        images_by_stem = {}  # (dataset, stem) -> image relpaths
+        for dataset in index.datasets:
+            for img_rel in index.images(dataset, image_exts, recursive=True, ignore_case=True):
+                images_by_stem.setdefault((dataset, os.path.splitext(img_rel)[0]), []).append(img_rel)
 
-    print("Fix complete. All labels set to class 0.")
+        removed = 0
+        for file_id in np.flatnonzero(emptied):
+            dataset, _, rel = store.paths[file_id].split("/", 2)
+            for img_rel in images_by_stem.get((dataset, os.path.splitext(rel)[0]), []):
+                os.remove(os.path.join(index.root, dataset, "images", img_rel))
+            os.remove(store.abs_path(file_id))
+            removed += 1
+        if removed:
+            fsindex.get_index(base_dir, refresh=True)  # so a split in the same run does not copy deleted files
+        print(f"Dropped {removed} images whose labels had no boxes left.")
+    else:
+        print(f"{int(emptied.sum())} label files are now empty (kept).")
 
 # ---MAIN---
-scan()
-input("Press enter to fix class")
-fix()
+if __name__ == "__main__":
+    scan()
+    input("Press enter to fix class")
+    remap()
+    metrics.report()
@@ -0,0 +1,240 @@
+import os
+import json
+import hashlib
+import sqlite3
+from tqdm import tqdm
+import metrics
+'''
+Shared filesystem index used by DuplicateCheck.py, Split.py and classfix.py.
+
+One os.scandir pass lists every dataset folder (a directory holding 'images' and/or 'labels') with the size and
+mtime of each file. The index is built once per run and shared by every caller. Directory listings are cached by
+directory mtime, so a refresh only re-lists folders where files were added, removed or renamed; set cache_file
+to keep that cache in SQLite between runs.
+
+Note: editing a file in place does not change its directory's mtime. Scripts that rewrite files go through a
+rename (which does), or call get_index(root, refresh=True, full=True). For the same reason stat() (and with it
+the stat-keyed result caches) does a real os.stat for files in directories whose listing came from cache_file.
+'''
+
+# === CONFIGURABLE ===
+cache_file = None  # e.g. ".fsindex.sqlite" (relative to the indexed root); None = keep the cache in memory only
+
+# === GLOBALS ===
+_indexes = {}  # root -> DatasetIndex built this run
+_dir_cache = {}  # directory -> (mtime_ns, [(name, is_dir, size, mtime_ns)])
+_dirty_dirs = set()
+_listed_dirs = set()  # directories scanned by this process (their stats are current)
+_reused_dirs = set()  # directories served from the persisted cache during the current build
+_loaded_cache = None
+
+class DatasetIndex:
+    """Datasets under one root: name -> {"images": {relpath: (size, mtime_ns)}, "labels": {...}}."""
+
+    def __init__(self, root):
+        self.root = root
+        self.datasets = {}
+        self.reused_dirs = set()  # sizes/mtimes listed here may be stale (in-place edits), see stat()
+
+    def find_datasets(self):
+        """Dataset names with both an images and a labels folder, sorted (directory order differs per filesystem)."""
+        return sorted(name for name, kinds in self.datasets.items() if "images" in kinds and "labels" in kinds)
+
+    def files(self, dataset, kind):
+        """{relpath: (size, mtime_ns)} of every file under <dataset>/<kind>; empty if the folder is missing."""
+        return self.datasets.get(dataset, {}).get(kind, {})
+
+    def has_folder(self, dataset, kind):
+        return kind in self.datasets.get(dataset, {})
+
+    def images(self, dataset, exts, recursive=False, ignore_case=False):
+        """Sorted image relpaths; recursive=False keeps only files directly in images/ (like os.listdir)."""
+        names = []
+        for rel in self.files(dataset, "images"):
+            if not recursive and "/" in rel:
+                continue
+            if (rel.lower() if ignore_case else rel).endswith(exts):
+                names.append(rel)
+        return sorted(names)
+
+    def has_label(self, dataset, image_rel):
+        return os.path.splitext(image_rel)[0] + ".txt" in self.files(dataset, "labels")
+
+    def label_files(self):
+        """Absolute paths of every .txt file under any dataset's labels folder."""
+        paths = []
+        for dataset, kinds in self.datasets.items():
+            for rel in sorted(kinds.get("labels", {})):
+                if rel.endswith(".txt"):
+                    paths.append(os.path.join(self.root, dataset, "labels", rel))
+        return paths
+
+    def stat(self, path):
+        """(size, mtime_ns) of an indexed file, falling back to os.stat for paths outside the index or in a
+        directory whose listing came from cache_file (its stats predate any in-place edit since)."""
+        path = os.path.abspath(path)
+        if os.path.dirname(path) not in self.reused_dirs:
+            rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+            parts = rel.split("/", 2)
+            if len(parts) == 3:
+                entry = self.files(parts[0], parts[1]).get(parts[2])
+                if entry is not None:
+                    return entry
+        st = os.stat(path)
+        metrics.count("stat")
+        return st.st_size, st.st_mtime_ns
+
+def load_dir_cache(root):
+    global _loaded_cache
+    if cache_file is None or _loaded_cache == root:
+        return
+    _loaded_cache = root
+    db_path = os.path.join(root, cache_file)
+    if not os.path.exists(db_path):
+        return
+    try:
+        with sqlite3.connect(db_path) as db:
+            mtimes = dict(db.execute("SELECT path, mtime_ns FROM dirs"))
+            listings = {path: [] for path in mtimes}
+            for path, name, is_dir, size, mtime_ns in db.execute("SELECT dir, name, is_dir, size, mtime_ns FROM entries"):
+                if path in listings:
+                    listings[path].append((name, bool(is_dir), size, mtime_ns))
+    except sqlite3.Error as e:
+        print(f"Ignoring unreadable index cache {db_path}: {e}")
+        return
+    for path, mtime_ns in mtimes.items():
+        _dir_cache.setdefault(path, (mtime_ns, listings[path]))
+
+def save_dir_cache(root):
+    if cache_file is None or not _dirty_dirs:
+        return
+    with sqlite3.connect(os.path.join(root, cache_file)) as db:
+        db.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER)")
+        db.execute("CREATE TABLE IF NOT EXISTS entries (dir TEXT, name TEXT, is_dir INTEGER, size INTEGER, "
+                   "mtime_ns INTEGER, PRIMARY KEY (dir, name))")
+        for path in _dirty_dirs:
+            mtime_ns, listing = _dir_cache[path]
+            db.execute("REPLACE INTO dirs VALUES (?, ?)", (path, mtime_ns))
+            db.execute("DELETE FROM entries WHERE dir = ?", (path,))
+            db.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?)",
+                           [(path, name, int(is_dir), size, m) for name, is_dir, size, m in listing])
+    _dirty_dirs.clear()
+
+def list_dir(path, full=False):
+    """[(name, is_dir, size, mtime_ns)] of a directory, re-listed only when its mtime changed (or full=True)."""
+    mtime_ns = os.stat(path).st_mtime_ns
+    metrics.count("stat")
+    cached = _dir_cache.get(path)
+    if cached and cached[0] == mtime_ns and not full:
+        if path not in _listed_dirs:
+            _reused_dirs.add(path)
+        return cached[1]
+
+    listing = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    listing.append((entry.name, True, 0, 0))
+                else:
+                    st = entry.stat()
+                    listing.append((entry.name, False, st.st_size, st.st_mtime_ns))
+            except OSError:
+                continue  # vanished between listing and stat
+    metrics.count("scandir")
+    metrics.count("stat", len(listing))
+    _dir_cache[path] = (mtime_ns, listing)
+    _dirty_dirs.add(path)
+    _listed_dirs.add(path)
+    return listing
+
+def scan_tree(path, full=False, prefix=""):
+    """{relpath: (size, mtime_ns)} of every file below path ('/'-separated relpaths)."""
+    files = {}
+    for name, is_dir, size, mtime_ns in list_dir(path, full):
+        if is_dir:
+            files.update(scan_tree(os.path.join(path, name), full, prefix + name + "/"))
+        else:
+            files[prefix + name] = (size, mtime_ns)
+    return files
+
+def get_index(root=None, refresh=False, full=False):
+    """Returns the run's DatasetIndex for root, building it on first use.
+
+    refresh=True re-checks every directory mtime and re-lists the changed ones; full=True re-lists everything.
+    """
+    root = os.path.abspath(root or os.getcwd())
+    if root in _indexes and not refresh:
+        return _indexes[root]
+
+    with metrics.stage("index"):
+        load_dir_cache(root)
+        _reused_dirs.clear()
+        index = DatasetIndex(root)
+        for name, is_dir, _, _ in tqdm(list_dir(root, full), desc="Indexing datasets", unit="dir", leave=False):
+            if not is_dir:
+                continue
+            subdir = os.path.join(root, name)
+            kinds = {}
+            for sub, sub_is_dir, _, _ in list_dir(subdir, full):
+                if sub_is_dir and sub in ("images", "labels"):
+                    kinds[sub] = scan_tree(os.path.join(subdir, sub), full)
+            if kinds:
+                index.datasets[name] = kinds
+                metrics.count("files", sum(len(files) for files in kinds.values()))
+        index.reused_dirs = set(_reused_dirs)
+        save_dir_cache(root)
+    _indexes[root] = index
+    return index
+
+# === STAT-KEYED RESULT CACHES ===
+def load_cache(path):
+    """Loads a JSON cache of relpath -> [size, mtime_ns, value]; {} if missing or unreadable."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable cache {path}: {e}")
+        return {}
+
+def save_cache(path, cache):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
+
+def file_digest(path, chunk_size=1 << 20):
+    """Streams a file through BLAKE2b and returns the hex digest."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+            metrics.count("bytes_read", len(chunk))
+    return h.hexdigest()
+
+def cached_values(paths, cache, compute, desc, root=None):
+    """Returns {path: value}; compute(paths) only sees files whose size or mtime changed since the last run.
+
+    Stats come from the shared index, so checking a freshly listed tree costs no extra syscalls; files in
+    directories whose listing came from cache_file are stat'ed for real (see DatasetIndex.stat).
+    """
+    index = get_index(root)
+    values = {}
+    pending = []
+    for path in paths:
+        key = os.path.relpath(path, index.root)
+        size, mtime_ns = index.stat(path)
+        entry = cache.get(key)
+        if entry and entry[0] == size and entry[1] == mtime_ns:
+            values[path] = entry[2]
+        else:
+            pending.append((path, key, size, mtime_ns))
+
+    if pending:
+        results = compute([path for path, _, _, _ in pending])
+        for (path, key, size, mtime_ns), value in tqdm(zip(pending, results), total=len(pending), desc=desc, unit="file"):
+            values[path] = value
+            cache[key] = [size, mtime_ns, value]
+    return values
@@ -0,0 +1,238 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+import fsindex
+import metrics
+'''
+Image integrity check used by Split.py and DuplicateCheck.py (flagIntegrity) or on its own.
+
+Reads only the header (format, width, height) and the end marker of each image: JPEG SOI ... EOI (FF D8 ... FF D9),
+PNG signature + IHDR ... IEND. Files that do not end in their end marker are looked at more closely: the PNG chunk
+chain is walked to IEND, and a JPEG is searched for the EOI that follows its scan data. Bytes after the end marker
+(phone trailers, motion photos) are reported as "trailing data"; only a missing end marker is "truncated".
+flagFullDecode additionally decodes every image with Pillow. Checks run on a process pool and verdicts are cached
+by (path, size, mtime), so re-runs only look at new or changed files.
+
+Verdict per image: [format, width, height, issue]; issue is None for a good file, otherwise one of
+"zero-byte", "unknown format", "truncated", "corrupt", "trailing data" or "extension mismatch".
+'''
+
+# === CONFIGURABLE ===
+workers = 8  # Processes checking images concurrently
+flagFullDecode = False  # Also decode every image with Pillow (slow; catches corrupt scan data inside the file)
+cache_file = "integrity_cache.json"  # Relative to the dataset root
+report_file = "integrity_report.json"  # Flagged images written by scan()
+exclude_issues = ("zero-byte", "unknown format", "truncated", "corrupt")  # Issues that exclude an image from
+# Split.py / DuplicateCheck.py; "trailing data" and "extension mismatch" are only reported, the image still loads
+
+EXTENSION_FORMATS = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png"}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+CHECK_VERSION = 2  # bumped when verdicts change meaning, so cached verdicts of older checks are not reused
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}  # start-of-frame markers carrying the image size
+
+def sniff_format(head):
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(PNG_SIGNATURE):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+def jpeg_segments(f):
+    """Yields (marker, segment length) for each JPEG segment from SOI on, with f at the segment's data; stops at EOI
+    or where the chain breaks. The caller may read into the data; the next step seeks past it."""
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":  # tolerate garbage between segments
+            byte = f.read(1)
+        while byte == b"\xff":  # fill bytes
+            byte = f.read(1)
+        if not byte:
+            return
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # standalone markers
+        if marker == 0xD9:
+            return
+        length = f.read(2)
+        if len(length) < 2:
+            return
+        segment = int.from_bytes(length, "big")
+        data_start = f.tell()
+        yield marker, segment
+        f.seek(data_start + segment - 2)
+
+def jpeg_size(f):
+    """(width, height) from the first SOF segment; None if the segment chain is broken."""
+    for marker, _ in jpeg_segments(f):
+        if marker == 0xDA:
+            return None  # scan data before any frame header
+        if marker in SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            return int.from_bytes(data[3:5], "big"), int.from_bytes(data[1:3], "big")
+    return None
+
+def jpeg_scan_start(f):
+    """Offset of the entropy-coded data after the first SOS header; None if the segment chain is broken."""
+    for marker, segment in jpeg_segments(f):
+        if marker == 0xDA:
+            return f.tell() + segment - 2
+    return None
+
+def jpeg_end(f, chunk_size=1 << 20):
+    """Offset just past the EOI that ends the scan data; None if there is none (truncated).
+
+    Inside entropy-coded data 0xFF is always stuffed, so the first FF D9 after the SOS header is the real end of
+    the image (an EXIF thumbnail's EOI sits before SOS and is skipped)."""
+    start = jpeg_scan_start(f)
+    if start is None:
+        return None
+    f.seek(start)
+    offset, carry = start, b""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return None
+        found = (carry + chunk).find(b"\xff\xd9")
+        if found >= 0:
+            return offset - len(carry) + found + 2
+        carry = chunk[-1:]
+        offset += len(chunk)
+
+def png_end(f, size):
+    """Offset just past the IEND chunk, walking the chunk chain; None if the chain runs past the end of the file."""
+    offset = 8
+    while offset + 8 <= size:
+        f.seek(offset)
+        header = f.read(8)
+        offset += 12 + int.from_bytes(header[:4], "big")
+        if header[4:8] == b"IEND":
+            return offset if offset <= size else None
+    return None
+
+def check_image(path, full=False):
+    """Returns the [format, width, height, issue] verdict of one image."""
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return [None, 0, 0, "zero-byte"]
+        with open(path, "rb") as f:
+            head = f.read(32)
+            fmt = sniff_format(head)
+            width = height = 0
+            issue = None
+            if fmt == "jpeg":
+                dims = jpeg_size(f)
+                f.seek(max(size - 64, 0))
+                tail = f.read().rstrip(b"\x00\r\n ")  # some encoders pad after EOI
+                if dims is None:
+                    issue = "corrupt"
+                else:
+                    width, height = dims
+                if not tail.endswith(b"\xff\xd9"):
+                    end = jpeg_end(f)
+                    if end is None:
+                        issue = "truncated"
+                    elif issue is None:
+                        issue = "trailing data"
+            elif fmt == "png":
+                if head[12:16] != b"IHDR":
+                    issue = "corrupt"
+                else:
+                    width, height = int.from_bytes(head[16:20], "big"), int.from_bytes(head[20:24], "big")
+                f.seek(max(size - 12, 0))
+                if f.read(12) != PNG_IEND:
+                    if png_end(f, size) is None:
+                        issue = "truncated"
+                    elif issue is None:
+                        issue = "trailing data"
+            elif fmt is None:
+                return [None, 0, 0, "unknown format"]
+    except OSError:
+        return [None, 0, 0, "corrupt"]
+
+    if issue in (None, "trailing data") and full:
+        try:
+            from PIL import Image
+            with Image.open(path) as img:
+                img.load()
+                width, height = img.size
+        except Exception:
+            issue = "corrupt"
+    if issue is None and EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower(), fmt) != fmt:
+        issue = "extension mismatch"
+    return [fmt, width, height, issue]
+
+def check_images(paths, full=False):
+    """Yields verdicts in order, checked on a process pool."""
+    if not paths:
+        return
+    metrics.count("files", len(paths))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(check_image, paths, [full] * len(paths), chunksize=64)
+
+def verify(paths, root=None):
+    """Returns {path: verdict}; only files that changed since the last run (per check mode) are read."""
+    root = fsindex.get_index(root).root
+    cache_path = os.path.join(root, cache_file)
+    cache = fsindex.load_cache(cache_path)
+    mode = f"{'full' if flagFullDecode else 'header'}-v{CHECK_VERSION}"
+    with metrics.stage("integrity"):
+        verdicts = fsindex.cached_values(paths, cache.setdefault(mode, {}),
+                                         lambda pending: check_images(pending, flagFullDecode),
+                                         "Checking images", root=root)
+    fsindex.save_cache(cache_path, cache)
+    for path, verdict in verdicts.items():
+        if verdict[3] is not None:
+            metrics.warn(f"image {verdict[3]}", path)
+    return verdicts
+
+def dataset_images(root=None, datasets=None):
+    """Absolute paths of every image in the given datasets (default: all)."""
+    index = fsindex.get_index(root)
+    paths = []
+    for dataset in datasets if datasets is not None else index.find_datasets():
+        images_path = os.path.join(index.root, dataset, "images")
+        paths.extend(os.path.join(images_path, rel)
+                     for rel in index.images(dataset, tuple(EXTENSION_FORMATS), recursive=True, ignore_case=True))
+    return paths
+
+def bad_images(root=None, datasets=None):
+    """Set of absolute image paths with an issue in exclude_issues."""
+    verdicts = verify(dataset_images(root, datasets), root)
+    return {path for path, verdict in verdicts.items() if verdict[3] in exclude_issues}
+
+def scan(root=None, datasets=None):
+    """Checks every image, prints counts per issue and saves the flagged images to report_file."""
+    verdicts = verify(dataset_images(root, datasets), root)
+    root = fsindex.get_index(root).root
+    report = {}
+    for path, (fmt, width, height, issue) in sorted(verdicts.items()):
+        if issue is not None:
+            report[os.path.relpath(path, root).replace(os.sep, "/")] = {"issue": issue, "format": fmt,
+                                                                         "width": width, "height": height}
+    report_path = os.path.join(root, report_file)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+
+    counts = {}
+    for entry in report.values():
+        counts[entry["issue"]] = counts.get(entry["issue"], 0) + 1
+    print(f"Checked {len(verdicts)} images ({'full decode' if flagFullDecode else 'headers and end markers'}).")
+    for issue, count in sorted(counts.items()):
+        print(f"- {issue}: {count}")
+    print(f"{len(report)} flagged images saved as: {report_path}")
+    return report
+
+if __name__ == "__main__":
+    scan()
+    metrics.report()
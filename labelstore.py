@@ -0,0 +1,220 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from tqdm import tqdm
+import fsindex
+import metrics
+'''
+Columnar store of every YOLO box under a dataset root, replacing class_scan_log.json.
+
+label_store/
+|->files.json    file table: relative path, size, mtime_ns and malformed-line count per label file
+|->offsets.npy   int64 [files + 1]; boxes of file i are rows offsets[i]:offsets[i + 1]
+|->file_ids.npy  int32 [boxes]
+|->class_ids.npy int32 [boxes]
+|->boxes.npy     float32 [boxes, 4] = cx, cy, w, h
+
+Arrays are memory-mapped on load, so opening the store parses no text. build_store() only re-parses label files
+whose size or mtime changed since the last build.
+'''
+
+# === CONFIGURABLE ===
+store_dir = "label_store"  # Relative to the dataset root
+workers = 8  # Label files parsed concurrently on (re)build
+process_threshold = 5000  # Above this many files spread over several directories, parse on a process pool
+chunk_files = 2000  # Max files per process-pool task (tasks never span directories)
+
+def parse_label_file(path):
+    """Returns (class ids, [[cx, cy, w, h]], malformed line count) of one YOLO label file."""
+    classes = []
+    boxes = []
+    bad_lines = 0
+    with open(path, "r") as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if len(parts) != 5:
+                bad_lines += 1
+                continue
+            try:
+                cls = int(parts[0])
+                box = [float(x) for x in parts[1:]]
+            except ValueError:
+                bad_lines += 1
+                continue
+            classes.append(cls)
+            boxes.append(box)
+    return classes, boxes, bad_lines
+
+def parse_label_chunk(paths):
+    return [parse_label_file(path) for path in paths]
+
+def parse_label_files(paths):
+    """Yields parse_label_file() results in order: threads for small or single-directory sets, otherwise one
+    process-pool task per directory chunk so parsing is not bound to one core."""
+    directories = {os.path.dirname(path) for path in paths}
+    if len(paths) < process_threshold or len(directories) < 2:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(parse_label_file, paths)
+        return
+
+    chunks = []
+    for path in paths:
+        if chunks and len(chunks[-1]) < chunk_files and os.path.dirname(chunks[-1][0]) == os.path.dirname(path):
+            chunks[-1].append(path)
+        else:
+            chunks.append([path])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(parse_label_chunk, chunks):
+            yield from results
+
+class LabelStore:
+    """File table plus per-box arrays; every query is a NumPy operation over all boxes at once."""
+
+    def __init__(self, root, paths, sizes, mtimes, bad_lines, file_ids, class_ids, boxes):
+        self.root = root
+        self.paths = paths  # relative to root, '/'-separated
+        self.sizes = sizes
+        self.mtimes = mtimes
+        self.bad_lines = bad_lines
+        self.file_ids = file_ids
+        self.class_ids = class_ids
+        self.boxes = boxes
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(file_ids, minlength=len(paths))))).astype(np.int64)
+        self._path_ids = None
+
+    @classmethod
+    def load(cls, root=".", mmap=True):
+        """Opens root/store_dir; None if no store has been built yet."""
+        root = os.path.abspath(root)
+        directory = os.path.join(root, store_dir)
+        if not os.path.exists(os.path.join(directory, "files.json")):
+            return None
+        with open(os.path.join(directory, "files.json"), "r") as f:
+            table = json.load(f)
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode)
+                  for name in ("file_ids", "class_ids", "boxes")}
+        return cls(root, table["paths"], table["sizes"], table["mtimes"], table["bad_lines"],
+                   arrays["file_ids"], arrays["class_ids"], arrays["boxes"])
+
+    def save(self):
+        directory = os.path.join(self.root, store_dir)
+        os.makedirs(directory, exist_ok=True)
+        for name, array in (("offsets", self.offsets), ("file_ids", self.file_ids),
+                            ("class_ids", self.class_ids), ("boxes", self.boxes)):
+            tmp_path = os.path.join(directory, f"{name}.npy.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        table = {"paths": self.paths, "sizes": self.sizes, "mtimes": self.mtimes, "bad_lines": self.bad_lines}
+        tmp_path = os.path.join(directory, "files.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(table, f)
+        os.replace(tmp_path, os.path.join(directory, "files.json"))
+
+    def abs_path(self, file_id):
+        return os.path.join(self.root, *self.paths[file_id].split("/"))
+
+    def file_id(self, path):
+        if self._path_ids is None:
+            self._path_ids = {p: i for i, p in enumerate(self.paths)}
+        rel = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+        return self._path_ids.get(rel)
+
+    def class_counts(self):
+        """{class id: box count} via one bincount."""
+        if len(self.class_ids) == 0:
+            return {}
+        counts = np.bincount(self.class_ids - self.class_ids.min())
+        offset = int(self.class_ids.min())
+        return {int(i) + offset: int(c) for i, c in enumerate(counts) if c}
+
+    def boxes_for(self, path):
+        """(class ids, [cx, cy, w, h] rows) of one label file; empty arrays if it is not in the store."""
+        file_id = self.file_id(path)
+        if file_id is None:
+            return self.class_ids[:0], self.boxes[:0]
+        start, end = self.offsets[file_id], self.offsets[file_id + 1]
+        return self.class_ids[start:end], self.boxes[start:end]
+
+    def select(self, class_ids=None, min_area=None, max_area=None):
+        """Boolean mask over all boxes matching every given filter."""
+        mask = np.ones(len(self.class_ids), dtype=bool)
+        if class_ids is not None:
+            mask &= np.isin(self.class_ids, list(class_ids))
+        if min_area is not None or max_area is not None:
+            area = self.boxes[:, 2] * self.boxes[:, 3]
+            if min_area is not None:
+                mask &= area >= min_area
+            if max_area is not None:
+                mask &= area <= max_area
+        return mask
+
+    def files_where(self, mask):
+        """Absolute paths of label files with at least one box in mask."""
+        return [self.abs_path(i) for i in np.unique(self.file_ids[mask])]
+
+def build_store(base_dir="."):
+    """Builds or incrementally updates base_dir/store_dir from the shared index and saves it."""
+    index = fsindex.get_index(base_dir, refresh=True)
+    root = index.root
+    # Loaded into memory: save() replaces the .npy files, which Windows refuses while they are still mapped
+    old = LabelStore.load(root, mmap=False)
+
+    label_files = index.label_files()
+    paths = [os.path.relpath(path, root).replace(os.sep, "/") for path in label_files]
+    stats = [index.stat(path) for path in label_files]
+
+    # Reuse rows of unchanged files, remapping their file ids into the new table
+    old_ids = {path: i for i, path in enumerate(old.paths)} if old is not None else {}
+    remap = np.full(len(old.paths) if old is not None else 0, -1, dtype=np.int64)
+    to_parse = []
+    for new_id, (path, (size, mtime_ns)) in enumerate(zip(paths, stats)):
+        old_id = old_ids.get(path)
+        if old_id is not None and old.sizes[old_id] == size and old.mtimes[old_id] == mtime_ns:
+            remap[old_id] = new_id
+        else:
+            to_parse.append(new_id)
+
+    bad_lines = [0] * len(paths)
+    file_parts, class_parts, box_parts = [], [], []
+    if old is not None and len(old.file_ids):
+        keep = remap[old.file_ids] >= 0
+        file_parts.append(remap[old.file_ids[keep]])
+        class_parts.append(np.asarray(old.class_ids[keep]))
+        box_parts.append(np.asarray(old.boxes[keep]))
+        for old_id, new_id in enumerate(remap):
+            if new_id >= 0:
+                bad_lines[new_id] = old.bad_lines[old_id]
+    old = None
+
+    with metrics.stage("parse_labels"):
+        metrics.count("files", len(to_parse))
+        metrics.count("bytes_read", sum(stats[i][0] for i in to_parse))
+        parsed = parse_label_files([label_files[i] for i in to_parse])
+        for new_id, (classes, boxes, bad) in tqdm(zip(to_parse, parsed), total=len(to_parse), desc="Parsing label files", unit="file"):
+            bad_lines[new_id] = bad
+            if classes:
+                file_parts.append(np.full(len(classes), new_id, dtype=np.int64))
+                class_parts.append(np.asarray(classes, dtype=np.int32))
+                box_parts.append(np.asarray(boxes, dtype=np.float32))
+
+    if file_parts:
+        file_ids = np.concatenate(file_parts)
+        order = np.argsort(file_ids, kind="stable")
+        file_ids = file_ids[order].astype(np.int32)
+        class_ids = np.concatenate(class_parts)[order].astype(np.int32)
+        boxes = np.concatenate(box_parts)[order].astype(np.float32)
+    else:
+        file_ids = np.zeros(0, dtype=np.int32)
+        class_ids = np.zeros(0, dtype=np.int32)
+        boxes = np.zeros((0, 4), dtype=np.float32)
+
+    store = LabelStore(root, paths, [size for size, _ in stats], [mtime_ns for _, mtime_ns in stats],
+                       bad_lines, file_ids, class_ids, boxes)
+    store.save()
+    print(f"Label store: {len(paths)} files ({len(to_parse)} parsed, {len(paths) - len(to_parse)} reused), {len(class_ids)} boxes.")
+    return store
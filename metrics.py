@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+'''
+Per-stage timing and I/O counters shared by DuplicateCheck.py, Split.py, classfix.py and fsindex.py.
+
+    with metrics.stage("copy"):
+        metrics.count("files", 2)
+        metrics.count("bytes_written", nbytes)
+    metrics.warn("missing label", path)
+    metrics.report()
+
+Counters go to the stage innermost at the time count() is called (stages nest, e.g. "scan" inside "hash"); that
+includes calls from worker threads, so open no further stage while a pool is still counting into the current
+one. Per-file problems are aggregated by category with a few example paths instead of being printed one line
+per file.
+'''
+
+# === CONFIGURABLE ===
+trace_file = None  # e.g. "metrics.json"; None = only print the summary
+trace_format = "json"  # "json" = stage records + warnings; "chrome" = trace events for chrome://tracing / Perfetto
+max_examples = 3  # Example paths kept (and printed) per warning category
+flagSummary = True
+
+# === GLOBALS ===
+_lock = threading.Lock()
+_origin = time.perf_counter()
+_open = []  # stack of stages still running
+_records = []  # finished stages, in completion order
+_warnings = {}  # category -> {"count": n, "examples": [...]}
+
+@contextmanager
+def stage(name):
+    """Times a block and collects the counters recorded while it runs."""
+    record = {"name": name, "depth": len(_open), "start": time.perf_counter() - _origin, "seconds": 0.0, "counters": {}}
+    _open.append(record)
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - _origin - record["start"]
+        _open.remove(record)
+        _records.append(record)
+
+def count(name, amount=1):
+    """Adds to a counter of the innermost open stage (files, bytes_read, bytes_written, or an operation name)."""
+    if not _open:
+        return
+    with _lock:
+        counters = _open[-1]["counters"]
+        counters[name] = counters.get(name, 0) + amount
+
+def warn(category, detail=None):
+    """Counts one per-file problem; the first max_examples details are kept for the summary."""
+    with _lock:
+        entry = _warnings.setdefault(category, {"count": 0, "examples": []})
+        entry["count"] += 1
+        if detail is not None and len(entry["examples"]) < max_examples:
+            entry["examples"].append(str(detail))
+
+def reset():
+    del _records[:]
+    _warnings.clear()
+
+def merged_records():
+    """Stages in start order, with back-to-back runs of the same stage (e.g. one "hash" per dataset) folded into
+    one record; yields (record, number of runs)."""
+    merged = []
+    for record in sorted(_records, key=lambda r: r["start"]):
+        last = merged[-1][0] if merged else None
+        if last is not None and last["name"] == record["name"] and last["depth"] == record["depth"]:
+            last["seconds"] += record["seconds"]
+            for key, value in record["counters"].items():
+                last["counters"][key] = last["counters"].get(key, 0) + value
+            merged[-1][1] += 1
+        else:
+            merged.append([dict(record, counters=dict(record["counters"])), 1])
+    return merged
+
+def summary():
+    """Prints one line per stage (nested stages indented) and one line per warning category."""
+    if not _records and not _warnings:
+        return
+    print("\n========= Run Metrics =========")
+    for record, calls in merged_records():
+        counters = dict(record["counters"])
+        files = counters.pop("files", 0)
+        parts = [f"{record['seconds']:8.2f} s" + (f" ({calls} calls)" if calls > 1 else "")]
+        if files:
+            parts.append(f"{files} files ({files / max(record['seconds'], 1e-9):.0f}/s)")
+        for key in ("bytes_read", "bytes_written"):
+            if key in counters:
+                parts.append(f"{key.split('_')[1]} {counters.pop(key) / (1024 * 1024):.1f} MB")
+        if counters:
+            parts.append(", ".join(f"{key}={value}" for key, value in sorted(counters.items())))
+        print(f"{'  ' * record['depth']}{record['name']:<{22 - 2 * record['depth']}} " + " | ".join(parts))
+    if _warnings:
+        print("Warnings:")
+        for category, entry in sorted(_warnings.items()):
+            examples = f" (e.g. {', '.join(entry['examples'])})" if entry["examples"] else ""
+            print(f"- {category}: {entry['count']}{examples}")
+
+def write_trace(path=None, kind=None):
+    """Writes the stages and warnings as JSON, or as Chrome trace events ('X' spans in microseconds)."""
+    path = path or trace_file
+    kind = kind or trace_format
+    records = sorted(_records, key=lambda r: r["start"])
+    if kind == "chrome":
+        pid = os.getpid()
+        trace = {"traceEvents": [
+            {"name": r["name"], "ph": "X", "pid": pid, "tid": 0, "ts": r["start"] * 1e6, "dur": r["seconds"] * 1e6,
+             "args": r["counters"]} for r in records
+        ] + [
+            {"name": category, "ph": "i", "s": "g", "pid": pid, "tid": 0, "ts": 0, "args": entry}
+            for category, entry in sorted(_warnings.items())
+        ]}
+    else:
+        trace = {"stages": records, "warnings": _warnings}
+    with open(path, "w") as f:
+        json.dump(trace, f, indent=4)
+    return path
+
+def report():
+    """End-of-run output: the summary (if flagSummary) and the trace file (if trace_file is set)."""
+    if flagSummary:
+        summary()
+    if trace_file:
+        print(f"Metrics trace saved as: {write_trace()}")
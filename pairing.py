@@ -0,0 +1,149 @@
+import os
+import json
+import fsindex
+import metrics
+'''
+Pre-flight image/label pairing check, run before Split.py (flagPreflight) or duplicate deletion.
+
+Works on the shared index (no per-file os.path.exists): per dataset, one pass over images/ and one over labels/
+builds stem -> file maps, and set operations give
+- orphan_images:  images without a label (YOLO trains them as background)
+- orphan_labels:  labels without an image
+- case_mismatch:  image and label stems equal only ignoring case ("IMG_1.jpg" + "img_1.txt"), or a ".TXT" label;
+                  invisible to YOLO on case-sensitive filesystems
+- upper_ext:      images with an upper-case extension (".JPG"), which Split.py's extension filter skips
+- shared_stem:    several images sharing one stem, and therefore one label ("a.jpg" + "a.png")
+
+action is then applied in bulk: "report" (only write the report), "exclude" (leave orphan images out of the
+split), "quarantine" (move orphan images and labels to quarantine_dir) or "empty_label" (write an empty label
+for each orphan image, making it an explicit background image).
+'''
+
+# === CONFIGURABLE ===
+action = "report"  # "report", "exclude", "quarantine" or "empty_label"
+flagFixCase = False  # Rename case-mismatched labels to their image's exact stem (and ".TXT" to ".txt")
+quarantine_dir = "quarantine"  # Relative to the dataset root; keeps the <dataset>/<images|labels>/ layout
+report_file = "pairing_report.json"
+image_exts = ('.jpg', '.jpeg', '.png')
+
+def pair_dataset(index, dataset):
+    """Pairing problems of one dataset as {problem: [relpaths or (image, label) relpath pairs]}."""
+    images = {}  # stem -> [image relpaths]
+    upper_ext = []
+    for rel in index.files(dataset, "images"):
+        stem, ext = os.path.splitext(rel)
+        if ext.lower() not in image_exts:
+            continue
+        images.setdefault(stem, []).append(rel)
+        if ext != ext.lower():
+            upper_ext.append(rel)
+
+    labels = {}  # stem -> label relpath
+    for rel in index.files(dataset, "labels"):
+        stem, ext = os.path.splitext(rel)
+        if ext.lower() == ".txt":
+            labels[stem] = rel
+
+    image_stems, label_stems = set(images), set(labels)
+    # Exact stem with a ".TXT" label is a case problem too: YOLO only looks for ".txt"
+    exact = {stem for stem in image_stems & label_stems if labels[stem].endswith(".txt")}
+    loose_labels = {stem.lower(): stem for stem in label_stems - exact}
+
+    orphan_images, case_mismatch = [], []
+    for stem in sorted(image_stems - exact):
+        label_stem = loose_labels.get(stem.lower())
+        if label_stem is not None:
+            case_mismatch.append((images[stem][0], labels[label_stem]))
+        else:
+            orphan_images.extend(images[stem])
+    matched_labels = exact | {loose_labels[stem.lower()] for stem in image_stems if stem.lower() in loose_labels}
+
+    return {
+        "orphan_images": sorted(orphan_images),
+        "orphan_labels": sorted(labels[stem] for stem in label_stems - matched_labels),
+        "case_mismatch": case_mismatch,
+        "upper_ext": sorted(upper_ext),
+        "shared_stem": sorted(rel for stem in image_stems if len(images[stem]) > 1 for rel in images[stem]),
+    }
+
+def check(root=None, datasets=None):
+    """Checks every dataset (default: all in the index), prints a count table and writes report_file."""
+    index = fsindex.get_index(root)
+    datasets = datasets if datasets is not None else index.find_datasets()
+    report = {}
+    with metrics.stage("pairing"):
+        for dataset in datasets:
+            if not index.has_folder(dataset, "images"):
+                continue
+            report[dataset] = pair_dataset(index, dataset)
+            metrics.count("files", len(index.files(dataset, "images")) + len(index.files(dataset, "labels")))
+
+    report_path = os.path.join(index.root, report_file)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+
+    problems = ("orphan_images", "orphan_labels", "case_mismatch", "upper_ext", "shared_stem")
+    print("Image/label pairing:")
+    print(f"{'dataset':<20}" + "".join(f"{problem:>15}" for problem in problems))
+    for dataset, entry in report.items():
+        print(f"{dataset:<20}" + "".join(f"{len(entry[problem]):>15}" for problem in problems))
+    print(f"Pairing report saved as: {report_path}")
+    return report
+
+def move_to_quarantine(root, dataset, kind, rel):
+    src = os.path.join(root, dataset, kind, rel)
+    dst = os.path.join(root, quarantine_dir, dataset, kind, rel)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(src, dst)
+    metrics.count("rename")
+
+def resolve(report, root=None):
+    """Applies flagFixCase and action to a check() report; returns absolute paths of images to leave out."""
+    index = fsindex.get_index(root)
+    root = index.root
+    excluded = set()
+    changed = False
+    with metrics.stage("pairing_fix"):
+        for dataset, entry in report.items():
+            if flagFixCase:
+                for img_rel, lbl_rel in entry["case_mismatch"]:
+                    target = os.path.join(root, dataset, "labels", os.path.splitext(img_rel)[0] + ".txt")
+                    os.replace(os.path.join(root, dataset, "labels", lbl_rel), target)
+                    metrics.count("rename")
+                    changed = True
+            elif action == "exclude":
+                # Unfixed case mismatches are unlabeled as far as YOLO is concerned. (Not for quarantine or
+                # empty_label: moving the image or writing a second label could clobber the real one on
+                # case-insensitive filesystems.)
+                entry = dict(entry, orphan_images=entry["orphan_images"] + [img for img, _ in entry["case_mismatch"]])
+
+            if action == "exclude":
+                excluded.update(os.path.join(root, dataset, "images", rel) for rel in entry["orphan_images"])
+            elif action == "quarantine":
+                for rel in entry["orphan_images"]:
+                    move_to_quarantine(root, dataset, "images", rel)
+                for rel in entry["orphan_labels"]:
+                    move_to_quarantine(root, dataset, "labels", rel)
+                changed = changed or bool(entry["orphan_images"] or entry["orphan_labels"])
+            elif action == "empty_label":
+                for rel in entry["orphan_images"]:
+                    path = os.path.join(root, dataset, "labels", os.path.splitext(rel)[0] + ".txt")
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    open(path, "w").close()
+                    metrics.count("files")
+                changed = changed or bool(entry["orphan_images"])
+            elif action != "report":
+                raise ValueError(f"Unknown pairing action: {action}")
+    if changed:
+        fsindex.get_index(root, refresh=True)
+    if action != "report":
+        print(f"Pairing action '{action}' applied" + (f" ({len(excluded)} images excluded)." if excluded else "."))
+    return excluded
+
+def preflight(root=None, datasets=None):
+    """check() + resolve(): the pass Split.py and pipeline.py run before splitting or deleting anything."""
+    return resolve(check(root, datasets), root)
+
+if __name__ == "__main__":
+    preflight()
+    metrics.report()
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import argparse
+'''
+Headless runner chaining pairing.py -> DuplicateCheck.py -> classfix.py -> Split.py in one process.
+
+usage: python pipeline.py [--config pipeline.json] [--root DIR] {run,pairing,dedup,classfix,split,undo,purge}
+
+The config is a JSON object with one section per stage. Section keys are the scripts' own module-level settings
+(e.g. "match_mode", "class_map", "train_folders", "output_mode"), plus a few runner options:
+
+{
+    "root": ".",
+    "stages": ["pairing", "dedup", "classfix", "split"],
+    "pairing": {"action": "exclude", "flagFixCase": true},
+    "dedup": {"match_mode": "hash", "flagGlobal": true, "keep_priority": ["6k"], "delete": "all", "delete_mode": "quarantine"},
+    "classfix": {"class_map": {"0": 0, "3": null}, "unmapped_class": "keep", "validate": true, "autofix": false},
+    "split": {"train_folders": ["richard1", "6k"], "test_folders": ["test"], "output_mode": "manifest"},
+    "metrics": {"trace_file": "pipeline_trace.json", "trace_format": "chrome"}
+}
+
+Stages share one in-memory dataset index (fsindex), and deletion streams the match log DuplicateCheck.py just
+wrote (or takes the in-memory log with log_format "json"). The scripts are imported only when their stage runs, so --help starts instantly.
+'''
+
+DEFAULT_CONFIG = "pipeline.json"
+STAGES = ("pairing", "dedup", "classfix", "split")
+
+# === GLOBALS ===
+excluded_images = set()  # images the pairing stage left out (action "exclude"), skipped by the split stage
+
+def load_config(path):
+    if path is None:
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def apply_settings(module, settings, runner_keys=()):
+    """Copies config keys onto a script's module-level settings; unknown keys stop the run instead of being ignored."""
+    for key, value in settings.items():
+        if key in runner_keys:
+            continue
+        if not hasattr(module, key):
+            sys.exit(f"Unknown setting '{key}' for {module.__name__}.py")
+        setattr(module, key, value)
+
+def run_pairing(root, settings):
+    """Image/label pre-flight over every dataset, applying pairing.action in bulk before anything is deleted."""
+    import pairing
+
+    apply_settings(pairing, settings)
+    excluded_images.update(pairing.preflight(root))
+
+def run_dedup(root, settings):
+    """Finds duplicates (global pass unless a 'base' dataset is given) and optionally deletes them.
+
+    'delete': "all" (every dataset except the base / keeping dataset), "base", or a list of dataset names.
+    """
+    import DuplicateCheck
+
+    apply_settings(DuplicateCheck, settings, runner_keys=("base", "delete"))
+    DuplicateCheck.cwd = root
+    if DuplicateCheck.flagGlobal or settings.get("base") is None:
+        DuplicateCheck.datasets = DuplicateCheck.find_datasets()
+        DuplicateCheck.find_duplicates_global()
+    else:
+        DuplicateCheck.dataset_selection(settings["base"])
+        DuplicateCheck.find_duplicates()
+    DuplicateCheck.save_match_log()
+
+    delete = settings.get("delete")
+    if not delete:
+        return
+    if delete == "all":
+        choice, selection = "1", None
+    elif delete == "base":
+        choice, selection = "3", None
+    else:
+        choice, selection = "2", list(delete)
+    DuplicateCheck.delete_duplicates(DuplicateCheck.base_dataset, DuplicateCheck.current_log(), choice, selection, assume_yes=True)
+
+def run_classfix(root, settings):
+    """Builds the label store, optionally validates (and autofixes) boxes, then applies the class remap.
+
+    Runner options: 'validate' (default false), 'autofix' (default false), 'remap' (default true).
+    """
+    import classfix
+
+    settings = dict(settings)
+    if "class_map" in settings:
+        settings["class_map"] = {int(k): v for k, v in settings["class_map"].items()}  # JSON keys are strings
+    apply_settings(classfix, settings, runner_keys=("validate", "autofix", "remap"))
+    classfix.scan(root)
+    if settings.get("validate"):
+        classfix.validate(root, autofix=settings.get("autofix", False))
+    if settings.get("remap", True):
+        classfix.remap(root)
+
+def run_split(root, settings):
+    import Split
+
+    Split.parent_dir = root
+    Split.base_dir = os.path.join(root, "Finaldata")
+    apply_settings(Split, settings)
+    Split.flagInteractive = False
+    Split.excluded_images.update(excluded_images)
+    Split.run()
+
+def run_quarantine(root, settings, command, run_id):
+    """undo / purge a duplicate quarantine run (default: the latest; purge also takes "all")."""
+    import DuplicateCheck
+
+    apply_settings(DuplicateCheck, settings, runner_keys=("base", "delete"))
+    DuplicateCheck.cwd = root
+    if command == "undo":
+        DuplicateCheck.undo_quarantine(run_id)
+    else:
+        DuplicateCheck.purge_quarantine(run_id)
+
+RUNNERS = {"pairing": run_pairing, "dedup": run_dedup, "classfix": run_classfix, "split": run_split}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pipeline.py", description="Headless dedup -> classfix -> split runner.")
+    parser.add_argument("--config", help=f"JSON config file (default: {DEFAULT_CONFIG} in the current directory, if present)")
+    parser.add_argument("--root", help="Dataset root (default: the config's 'root', else the current directory)")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+    commands.add_parser("run", help="run every stage in order (or the config's 'stages')")
+    commands.add_parser("pairing", help="check image/label pairing and apply the configured bulk action")
+    commands.add_parser("dedup", help="find (and optionally delete) duplicate images")
+    commands.add_parser("classfix", help="build the label store, validate and remap classes")
+    commands.add_parser("split", help="split into train/val/test")
+    for name, help in (("undo", "move a duplicate quarantine run back"), ("purge", "delete a duplicate quarantine run")):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("--run", help="quarantine run id (default: latest; purge also accepts 'all')")
+    args = parser.parse_args(argv)
+
+    config_path = args.config or (DEFAULT_CONFIG if os.path.exists(DEFAULT_CONFIG) else None)
+    config = load_config(config_path)
+    root = os.path.abspath(args.root or config.get("root", "."))
+    os.chdir(root)  # the scripts resolve their logs and caches against the working directory
+
+    import metrics
+    apply_settings(metrics, config.get("metrics") or {})
+    if args.command in ("undo", "purge"):
+        run_quarantine(root, config.get("dedup") or {}, args.command, args.run)
+        return
+
+    stages = config.get("stages", STAGES) if args.command == "run" else [args.command]
+    for stage in stages:
+        print(f"\n===== {stage} =====")
+        with metrics.stage(stage):
+            RUNNERS[stage](root, config.get(stage) or {})
+    metrics.report()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import re
+from difflib import SequenceMatcher
+'''
+Filename -> canonical source stem, and a stem index for name-based duplicate matching (DuplicateCheck.py
+match_mode "stem", Split.py split_strategy "group").
+
+Roboflow exports rename "<stem>.<ext>" to "<stem>_<ext>.rf.<hash>.<ext>" (re-exports repeat the suffix, with the
+inner dots turned into dashes); source_stem() strips those suffixes. canonical_stem() also lower-cases the stem
+and splits it into tokens at "-", "_", "." and spaces, so "IMG_0001.JPG", "img-0001_jpg.rf.<hash>.jpg" and
+"img 0001.png" all become "img-0001".
+
+StemIndex keeps canonical stems in a hash map (exact matches) and in a trie over their tokens (prefix and
+similarity matches). A lookup walks the query's tokens once and scores at most max_candidates stems, so
+indexing and matching N names is linear in N; no fixed character count is involved:
+- "exact":   same canonical stem
+- "prefix":  one stem is a token prefix of the other ("img-0001" / "img-0001-copy"), at least min_prefix_tokens
+             long and covering prefix_ratio of the longer one
+- "similar": the stems share their first token and their numbers ("frame-12" never matches "frame-13"), and
+             their difflib ratio is at least similarity
+'''
+
+# === CONFIGURABLE ===
+stem_match = "exact"  # "exact", "prefix" or "similar"
+min_prefix_tokens = 2  # "prefix": shortest shared run of leading tokens that can count as a match
+prefix_ratio = 0.5  # "prefix": share of the longer stem's tokens the shorter one must cover
+similarity = 0.9  # "similar": minimum difflib.SequenceMatcher ratio of the two canonical stems
+max_candidates = 8  # Stems scored per lookup in "prefix"/"similar" mode (longest shared prefix first)
+
+ROBOFLOW_NAME = re.compile(r"^(.+)_(?:jpe?g|png|bmp|webp)[.-]rf[.-][0-9a-f]+$", re.IGNORECASE)
+TOKEN_SEPARATORS = re.compile(r"[-_.\s]+")
+
+def source_stem(filename):
+    """'<stem>_<ext>.rf.<hash>.<ext>' (Roboflow export, also re-exported) -> '<stem>'; any other name -> name
+    without extension. Case is kept."""
+    stem = os.path.splitext(filename)[0]
+    match = ROBOFLOW_NAME.match(stem)
+    while match:
+        stem = match.group(1)
+        match = ROBOFLOW_NAME.match(stem)
+    return stem
+
+def stem_tokens(filename):
+    return tuple(token for token in TOKEN_SEPARATORS.split(source_stem(filename).lower()) if token)
+
+def canonical_stem(filename):
+    return "-".join(stem_tokens(filename))
+
+def numbers(tokens):
+    return [token for token in tokens if any(ch.isdigit() for ch in token)]
+
+def common_prefix(a, b):
+    size = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        size += 1
+    return size
+
+class StemIndex:
+    """Canonical stem -> items, with a token trie for "prefix" and "similar" lookups."""
+
+    def __init__(self, mode=None):
+        self.mode = mode or stem_match
+        self.items = {}  # canonical stem -> [items]
+        self.trie = {}  # token -> child node; node[None] = [stems ending here, first max_candidates stems below]
+
+    def add(self, filename, item):
+        tokens = stem_tokens(filename)
+        stem = "-".join(tokens)
+        if stem in self.items:
+            self.items[stem].append(item)
+            return
+        self.items[stem] = [item]
+        if self.mode == "exact":
+            return
+        node = self.trie
+        for token in tokens:
+            node = node.setdefault(token, {None: [[], []]})
+            below = node[None][1]
+            if len(below) < max_candidates:
+                below.append(stem)
+        if node is not self.trie:
+            node[None][0].append(stem)
+
+    def candidates(self, tokens):
+        """Stems sharing the longest token prefix with tokens, then stems that are a shorter prefix of them."""
+        node = self.trie
+        path = []
+        for token in tokens:
+            node = node.get(token)
+            if node is None:
+                break
+            path.append(node)
+        found = list(path[-1][None][1]) if path else []
+        for node in reversed(path):
+            found.extend(node[None][0])
+            if len(found) >= max_candidates:
+                break
+        return list(dict.fromkeys(found))[:max_candidates]
+
+    def lookup(self, filename):
+        """Canonical stems of the index that match filename under the index's mode."""
+        tokens = stem_tokens(filename)
+        stem = "-".join(tokens)
+        if stem in self.items:
+            return [stem]
+        if self.mode == "exact":
+            return []
+        if self.mode not in ("prefix", "similar"):
+            raise ValueError(f"Unknown stem_match mode: {self.mode}")
+        matches = []
+        for candidate in self.candidates(tokens):
+            other = candidate.split("-")
+            shared = common_prefix(tokens, other)
+            if self.mode == "prefix":
+                if (shared == min(len(tokens), len(other)) and shared >= min_prefix_tokens
+                        and shared >= prefix_ratio * max(len(tokens), len(other))):
+                    matches.append(candidate)
+            elif (shared and numbers(tokens) == numbers(other)
+                  and SequenceMatcher(None, stem, candidate).ratio() >= similarity):
+                matches.append(candidate)
+        return matches
+
+    def match(self, filename):
+        """Items of every matching stem."""
+        return [item for stem in self.lookup(filename) for item in self.items[stem]]